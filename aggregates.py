@@ -0,0 +1,383 @@
+"""
+Агреговані результати аналізу новин, які можна оновлювати порціями і зливати між собою.
+Основні функції з tools.py працюють з усім датафреймом одразу, а тут кожен аналіз зберігає лише
+свої підсумки: кількість публікацій за годинами, гістограми тональності та маніпулятивності,
+лічильники слів і сутностей, топ-10 списки на купах і кандидатів у копіпаст новини.
+Завдяки цьому той самий стан можна оновлювати по мірі надходження нових статей (service.py)
+і будувати з нього графіки та Markdown-звіт без повторного перерахунку всього корпусу.
+"""
+import heapq
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from tools import (
+    clean_text_column, analyze_sentiment_from_tokens, extract_entities, phrase_hit_counts, lemma_stream_column,
+    plot_hourly_counts, plot_word_cloud_from_frequencies, plot_binned_histogram,
+    plot_daily_sentiment, plot_entity_cloud,
+    repackaged_news_markdown, title_text_similarity_markdown, manipulative_language_markdown
+)
+
+# Фіксовані кошики гістограм, щоб часткові результати можна було просто додавати
+SENTIMENT_BINS = np.linspace(-1, 1, 41)
+MANIPULATION_BINS = np.linspace(0, 1, 31)
+TITLE_SIMILARITY_BINS = np.linspace(0, 1, 51)
+TOP_K = 10
+
+# Хешований векторизатор не має стану, тому дає однакові вектори в будь-якій порції
+_title_text_vectorizer = HashingVectorizer(n_features=2 ** 18, alternate_sign=False)
+
+
+def enrich_batch(batch_df, preprocess, nlp_ner_model, SIA_model, manipulative_automaton):
+    """
+    Додає до порції новин колонки, потрібні для агрегування.
+
+    preprocess — функція (text, cleaned) -> список лем з tools.make_preprocessor.
+    manipulative_automaton — tools.PhraseAutomaton зі словника маніпулятивних слів і виразів.
+    """
+    df = batch_df.dropna(subset=['title', 'date', 'text']).copy()
+    if df.empty:
+        # Без жодного рядка колонки втрачають рядковий тип, і .str нижче впаде
+        return df.reset_index(drop=True)
+    dates = df['date']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format='mixed', utc=True)
+    if dates.dt.tz is not None:
+        # Дати з часовим поясом переводимо в UTC без поясу: інакше їх не порівняти з наївними
+        dates = dates.dt.tz_convert(None)
+    df['date'] = dates
+    df['title'] = df['title'].astype('string')
+    df['text'] = df['text'].astype('string').str.replace(r'[\n\t\r]', ' ', regex=True)
+
+    # Леми без стоп-слів для аналізів і повний потік лем для пошуку виразів — за один прохід
+    processed = clean_text_column(df['text']).apply(lambda x: preprocess(x, cleaned=True, with_stream=True))
+    df['processed_text'] = processed.map(lambda pair: pair[0])
+    df['lemma_stream'] = processed.map(lambda pair: pair[1])
+    return enrich_processed(df, nlp_ner_model, SIA_model, manipulative_automaton)
+
+
+def enrich_processed(df, nlp_ner_model, SIA_model, manipulative_automaton):
+    """
+    Те саме для вже лематизованого корпусу (колонки processed_text і lemma_stream,
+    наприклад з main.py preprocess). Датафрейм змінюється на місці.
+    """
+    df['processed_text_str'] = df['processed_text'].apply(lambda tokens: " ".join(tokens))
+    df['sentiment_score'] = df['processed_text'].apply(
+        lambda tokens: analyze_sentiment_from_tokens(tokens, SIA_model)
+    )
+    df['entities'] = df['processed_text_str'].apply(lambda x: extract_entities(x, nlp_ner_model))
+    lemmas = lemma_stream_column(df)
+    df['manipulative_phrases'] = lemmas.apply(
+        lambda tokens: phrase_hit_counts(manipulative_automaton.count(tokens), manipulative_automaton)
+    )
+    df['manipulative_word_count'] = df['manipulative_phrases'].apply(lambda hits: sum(hits.values()))
+    df['manipulative_ratio'] = [
+        count / len(tokens) if len(tokens) > 0 else 0
+        for count, tokens in zip(df['manipulative_word_count'], lemmas)
+    ]
+
+    return df.reset_index(drop=True)
+
+
+def _push_top(heap, item, k):
+    if len(heap) < k:
+        heapq.heappush(heap, item)
+    else:
+        heapq.heappushpop(heap, item)
+
+
+class DuplicateDetector:
+    """
+    Пошук копіпаст новин, що накопичується порціями.
+
+    Кожна стаття зберігається як розріджений L2-нормований вектор з max_terms найчастіших лем,
+    тому нову порцію достатньо порівняти лише з уже збереженими блоками.
+    """
+
+    def __init__(self, threshold=0.9, n_features=2 ** 20, max_terms=64, max_pairs=100, block_rows=256):
+        self.threshold = threshold
+        self.max_terms = max_terms
+        self.max_pairs = max_pairs
+        self.block_rows = block_rows
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self.bin_edges = np.linspace(threshold, 1, 21)
+
+        self.blocks = []  # список (csr_matrix, titles)
+        self.n_documents = 0
+        self.n_pairs = 0
+        self.similarity_hist = np.zeros(len(self.bin_edges) - 1, dtype=np.int64)
+        self.top_pairs = []  # купа з (similarity, title_1, title_2)
+
+    def _vectorize(self, texts):
+        X = self.vectorizer.transform(texts).tocsr()
+        X.data = np.log1p(X.data)
+
+        # Залишаємо тільки найвагоміші терміни документа, щоб пам'ять на статтю була обмежена
+        if self.max_terms:
+            keep = np.zeros(X.nnz, dtype=bool)
+            for i in range(X.shape[0]):
+                start, end = X.indptr[i], X.indptr[i + 1]
+                if end - start <= self.max_terms:
+                    keep[start:end] = True
+                else:
+                    top = np.argpartition(X.data[start:end], -self.max_terms)[-self.max_terms:]
+                    keep[start + top] = True
+            X.data[~keep] = 0
+            X.eliminate_zeros()
+
+        return normalize(X).astype(np.float32)
+
+    def _record(self, similarity, title_1, title_2):
+        self.n_pairs += 1
+        bin_idx = np.searchsorted(self.bin_edges, similarity, side='right') - 1
+        self.similarity_hist[min(max(bin_idx, 0), len(self.similarity_hist) - 1)] += 1
+        _push_top(self.top_pairs, (float(similarity), title_1, title_2), self.max_pairs)
+
+    def _compare(self, A, titles_a, B, titles_b, same_block=False):
+        for start in range(0, A.shape[0], self.block_rows):
+            sims = (A[start:start + self.block_rows] @ B.T).tocoo()
+            mask = sims.data >= self.threshold
+            rows, cols, values = sims.row[mask] + start, sims.col[mask], sims.data[mask]
+            if same_block:
+                upper = rows < cols
+                rows, cols, values = rows[upper], cols[upper], values[upper]
+
+            for i, j, value in zip(rows, cols, values):
+                # Як і в detect_repackaged_news, однакові заголовки не вважаємо перепакуванням
+                if titles_a[i] != titles_b[j]:
+                    self._record(min(value, 1.0), titles_a[i], titles_b[j])
+
+    def _compact(self):
+        # Багато дрібних блоків (по одній статті) сповільнюють порівняння
+        if len(self.blocks) > 32:
+            matrix = sparse.vstack([block for block, _ in self.blocks]).tocsr()
+            titles = list(chain.from_iterable(block_titles for _, block_titles in self.blocks))
+            self.blocks = [(matrix, titles)]
+
+    def add(self, texts, titles):
+        titles = list(titles)
+        if not titles:
+            return
+
+        X = self._vectorize(texts)
+        self._compare(X, titles, X, titles, same_block=True)
+        for block, block_titles in self.blocks:
+            self._compare(X, titles, block, block_titles)
+
+        self.blocks.append((X, titles))
+        self.n_documents += len(titles)
+        self._compact()
+
+    def merge(self, other):
+        """Зливає результати іншого детектора, порівнюючи між собою документи обох."""
+        for other_block, other_titles in other.blocks:
+            for block, block_titles in self.blocks:
+                self._compare(other_block, other_titles, block, block_titles)
+
+        self.blocks.extend(other.blocks)
+        self.n_documents += other.n_documents
+        self.n_pairs += other.n_pairs
+        self.similarity_hist += other.similarity_hist
+        self.top_pairs = heapq.nlargest(self.max_pairs, self.top_pairs + other.top_pairs)
+        heapq.heapify(self.top_pairs)
+        self._compact()
+
+    def most_similar(self, k=TOP_K):
+        return sorted(self.top_pairs, reverse=True)[:k]
+
+
+class AnalysisAggregates:
+    """
+    Злиттєвий стан усіх аналізів з tools.py.
+
+    Пам'ять стану не залежить від кількості статей, крім пошуку копіпасту: DuplicateDetector
+    зберігає до 64 термінів на статтю. Для корпусів, більших за пам'ять, його можна вимкнути
+    через duplicate_threshold=None.
+    """
+
+    def __init__(self, duplicate_threshold=0.9, manipulative_dictionary_size=0):
+        self.n_articles = 0
+        self.date_min = None
+        self.date_max = None
+        self.manipulative_dictionary_size = manipulative_dictionary_size
+
+        self.hourly_counts = np.zeros(24, dtype=np.int64)
+        self.sentiment_hist = np.zeros(len(SENTIMENT_BINS) - 1, dtype=np.int64)
+        self.sentiment_sum = 0.0
+        self.daily_sentiment = {}  # дата -> [сума, кількість]
+
+        self.word_counts = Counter()
+        self.entity_counts = Counter()
+
+        self.manipulation_hist = np.zeros(len(MANIPULATION_BINS) - 1, dtype=np.int64)
+        self.top_manipulative = []  # купа з (ratio, count, title)
+        self.phrase_counts = Counter()  # вираз словника -> кількість збігів
+
+        self.title_similarity_hist = np.zeros(len(TITLE_SIMILARITY_BINS) - 1, dtype=np.int64)
+        self.least_similar_titles = []  # купа з (-similarity, title)
+
+        self.duplicates = DuplicateDetector(threshold=duplicate_threshold) if duplicate_threshold else None
+
+    def update(self, df):
+        """Додає до стану порцію, вже оброблену enrich_batch."""
+        if df.empty:
+            return
+
+        # Спершу рахуємо все, що може впасти на даних порції, і лише потім змінюємо стан,
+        # щоб невдала порція не лишила його напівоновленим
+        batch_min, batch_max = df['date'].min(), df['date'].max()
+        date_min = batch_min if self.date_min is None else min(self.date_min, batch_min)
+        date_max = batch_max if self.date_max is None else max(self.date_max, batch_max)
+        hourly_counts = np.bincount(df['date'].dt.hour, minlength=24)
+        scores = df['sentiment_score'].to_numpy(dtype=float)
+        daily = df.groupby(df['date'].dt.date)['sentiment_score'].agg(['sum', 'count'])
+        titles = _title_text_vectorizer.transform(df['title'].fillna(''))
+        texts = _title_text_vectorizer.transform(df['text'].fillna(''))
+        similarities = np.asarray(titles.multiply(texts).sum(axis=1)).ravel()
+        ratios = df['manipulative_ratio'].to_numpy(dtype=float)
+
+        self.n_articles += len(df)
+        self.date_min, self.date_max = date_min, date_max
+
+        # 1) Частота публікацій
+        self.hourly_counts += hourly_counts
+
+        # 2) Частота слів
+        self.word_counts.update(chain.from_iterable(df['processed_text']))
+
+        # 3) Тональність
+        self.sentiment_hist += np.histogram(scores, bins=SENTIMENT_BINS)[0]
+        self.sentiment_sum += scores.sum()
+        for day, row in daily.iterrows():
+            totals = self.daily_sentiment.setdefault(day, [0.0, 0])
+            totals[0] += row['sum']
+            totals[1] += int(row['count'])
+
+        # 4) Іменовані сутності
+        self.entity_counts.update(chain.from_iterable(df['entities']))
+
+        # 5) Копіпаст новини
+        if self.duplicates is not None:
+            self.duplicates.add(df['processed_text_str'].tolist(), df['title'].tolist())
+
+        # 6) Узгодженість заголовку і тексту
+        self.title_similarity_hist += np.histogram(np.clip(similarities, 0, 1), bins=TITLE_SIMILARITY_BINS)[0]
+        for title, similarity in zip(df['title'], similarities):
+            _push_top(self.least_similar_titles, (-float(similarity), title), TOP_K)
+
+        # 7) Маніпулятивність
+        self.manipulation_hist += np.histogram(ratios, bins=MANIPULATION_BINS)[0]
+        for title, count, ratio in zip(df['title'], df['manipulative_word_count'], ratios):
+            _push_top(self.top_manipulative, (float(ratio), int(count), title), TOP_K)
+        for hits in df['manipulative_phrases']:
+            self.phrase_counts.update(hits)
+
+    def merge(self, other):
+        """Зливає інший стан у цей (наприклад, результати іншого блоку чи шарду)."""
+        if other.n_articles == 0:
+            return self
+
+        self.n_articles += other.n_articles
+        self.date_min = other.date_min if self.date_min is None else min(self.date_min, other.date_min)
+        self.date_max = other.date_max if self.date_max is None else max(self.date_max, other.date_max)
+        self.manipulative_dictionary_size = max(self.manipulative_dictionary_size,
+                                                other.manipulative_dictionary_size)
+
+        self.hourly_counts += other.hourly_counts
+        self.sentiment_hist += other.sentiment_hist
+        self.sentiment_sum += other.sentiment_sum
+        for day, (total, count) in other.daily_sentiment.items():
+            totals = self.daily_sentiment.setdefault(day, [0.0, 0])
+            totals[0] += total
+            totals[1] += count
+
+        self.word_counts.update(other.word_counts)
+        self.entity_counts.update(other.entity_counts)
+
+        self.manipulation_hist += other.manipulation_hist
+        self.top_manipulative = heapq.nlargest(TOP_K, self.top_manipulative + other.top_manipulative)
+        heapq.heapify(self.top_manipulative)
+        self.phrase_counts.update(other.phrase_counts)
+
+        self.title_similarity_hist += other.title_similarity_hist
+        self.least_similar_titles = heapq.nlargest(TOP_K, self.least_similar_titles + other.least_similar_titles)
+        heapq.heapify(self.least_similar_titles)
+
+        if self.duplicates is not None and other.duplicates is not None:
+            self.duplicates.merge(other.duplicates)
+        return self
+
+    # ------------------------- Результати -------------------------
+    def mean_sentiment(self):
+        return self.sentiment_sum / self.n_articles if self.n_articles else 0.0
+
+    def daily_sentiment_means(self):
+        days = sorted(self.daily_sentiment)
+        return pd.Series([self.daily_sentiment[day][0] / self.daily_sentiment[day][1] for day in days],
+                         index=days, dtype=float)
+
+    def most_manipulative(self):
+        return sorted(self.top_manipulative, reverse=True)
+
+    def least_similar(self):
+        return [(title, -neg_similarity) for neg_similarity, title in sorted(self.least_similar_titles, reverse=True)]
+
+    def summary(self):
+        return {
+            'n_articles': self.n_articles,
+            'date_min': pd.Timestamp(self.date_min),
+            'date_max': pd.Timestamp(self.date_max),
+            'mean_sentiment': self.mean_sentiment(),
+        }
+
+    def figures(self):
+        """Ті самі графіки, що будує main(), але з агрегованого стану."""
+        figures = {
+            'publication_freq': plot_hourly_counts(pd.Series(self.hourly_counts, index=range(24))),
+            'wordcloud': plot_word_cloud_from_frequencies(self.word_counts),
+            'all_tonality': plot_binned_histogram(
+                self.sentiment_hist, SENTIMENT_BINS,
+                "Розподіл тональності новин", "Тональність (compound score)", "Кількість новин"
+            ),
+            'tonality_per_time': plot_daily_sentiment(self.daily_sentiment_means()),
+            'ner_visualization': plot_entity_cloud(self.entity_counts),
+            'title_text_similarity': plot_binned_histogram(
+                self.title_similarity_hist, TITLE_SIMILARITY_BINS,
+                'Схожість між заголовками і текстами (Cosine Similarity)', 'Cosine Similarity', 'Кількість новин'
+            ),
+            'manipulative_language': plot_binned_histogram(
+                self.manipulation_hist, MANIPULATION_BINS,
+                "Розподіл частки маніпулятивних слів у новинах", "Частка маніпулятивних слів", "Кількість новин",
+                color="darkorange"
+            ),
+        }
+        if self.duplicates is not None:
+            figures['repackaged_news'] = plot_binned_histogram(
+                self.duplicates.similarity_hist, self.duplicates.bin_edges,
+                "Розподіл косинусної подібності серед подібних новин", "Косинусна подібність", "Кількість пар"
+            )
+        return figures
+
+    def texts(self):
+        if self.duplicates is not None:
+            repackaged_text = repackaged_news_markdown(
+                [(title_1, title_2, similarity)
+                 for similarity, title_1, title_2 in self.duplicates.most_similar(TOP_K)],
+                self.duplicates.n_pairs, self.duplicates.threshold
+            )
+        else:
+            repackaged_text = "Пошук схожих новин вимкнено для цього запуску.\n"
+
+        return {
+            'repackaged_news': repackaged_text,
+            'title_text_similarity': title_text_similarity_markdown(self.least_similar()),
+            'manipulative_language': manipulative_language_markdown(
+                [(title, count, ratio) for ratio, count, title in self.most_manipulative()],
+                self.manipulative_dictionary_size, self.phrase_counts
+            ),
+        }
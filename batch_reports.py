@@ -0,0 +1,187 @@
+"""
+Пакетні звіти для багатьох вибірок одного корпусу: кожен сайт і всі сайти разом,
+по днях, по тижнях і за весь період.
+Корпус лематизується один раз (python main.py preprocess), NER, тональність і маніпулятивність
+рахуються один раз на статтю, а далі один прохід groupby по (сайт, день) будує AnalysisAggregates
+для кожної клітинки. Більші вікна не перераховуються заново, а зливаються з менших:
+сайт × тиждень і всі × день — з клітинок, всі × тиждень — з днів, весь період — з тижнів.
+Кожен звіт пишеться у свій каталог (output_dir/<сайт>/<вікно>/<початок вікна>/), графіки
+будуються паралельно в окремих процесах. Мережа спільних згадувань і семантичні дублікати
+тут не рахуються (як і в поблочному режимі main.py).
+
+Приклади:
+    python main.py preprocess --articles parsed_articles.csv
+    python batch_reports.py --input processed_articles.parquet --windows day,week,all --workers 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # Звіти будуються у фонових процесах, без вікон
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from aggregates import AnalysisAggregates, enrich_processed
+from report_generator import generate_markdown_report
+from tools import (
+    load_processed_articles, load_processed_lemmatizer, load_ner_model, load_sentiment_analyzer, make_preprocessor, site_from_url,
+    load_manipulative_phrases, PhraseAutomaton
+)
+
+ALL_SITES = 'all'
+WINDOWS = ['day', 'week', 'all']
+WINDOW_NAMES = {'day': 'день', 'week': 'тиждень'}
+
+
+def window_start(day, window):
+    """Перший день вікна, до якого належить day (тиждень починається з понеділка)."""
+    if window == 'day':
+        return day
+    if window == 'week':
+        return day - pd.Timedelta(days=day.weekday())
+    return None
+
+
+def aggregate_cells(news_df, duplicate_threshold=0.9, manipulative_dictionary_size=0):
+    """Один прохід по корпусу: {(сайт, день): AnalysisAggregates}."""
+    news_df = news_df.assign(site=news_df['url'].map(site_from_url), day=news_df['date'].dt.normalize())
+
+    cells = {}
+    for (site, day), cell_df in news_df.groupby(['site', 'day'], sort=True):
+        cell = AnalysisAggregates(duplicate_threshold=duplicate_threshold,
+                                  manipulative_dictionary_size=manipulative_dictionary_size)
+        cell.update(cell_df)
+        cells[(site, day)] = cell
+    return cells
+
+
+def _merge_all(parts, duplicate_threshold, manipulative_dictionary_size):
+    # Зливаємо в новий стан, щоб не змінювати менші вибірки, з яких він складається
+    merged = AnalysisAggregates(duplicate_threshold=duplicate_threshold,
+                                manipulative_dictionary_size=manipulative_dictionary_size)
+    for part in parts:
+        merged.merge(part)
+    return merged
+
+
+def build_slices(cells, windows=WINDOWS, by_site=True, duplicate_threshold=0.9, manipulative_dictionary_size=0):
+    """
+    Вибірки {(сайт, вікно, початок вікна): AnalysisAggregates} з клітинок (сайт, день).
+    Кожне вікно будується з найменших уже готових вибірок, тож попарні порівняння
+    пошуку копіпасту між документами не повторюються всередині вже злитих частин.
+    """
+    def group(items, key):
+        groups = {}
+        for item_key, aggregates in items.items():
+            groups.setdefault(key(item_key), []).append(aggregates)
+        return {group_key: _merge_all(parts, duplicate_threshold, manipulative_dictionary_size)
+                for group_key, parts in groups.items()}
+
+    slices = {}
+    site_days = {(site, 'day', day): cell for (site, day), cell in cells.items()}
+    all_days = group(site_days, lambda key: (ALL_SITES, 'day', key[2]))
+    if 'day' in windows:
+        slices.update(all_days)
+    if 'week' in windows or 'all' in windows:
+        all_weeks = group(all_days, lambda key: (ALL_SITES, 'week', window_start(key[2], 'week')))
+        if 'week' in windows:
+            slices.update(all_weeks)
+        if 'all' in windows:
+            slices.update(group(all_weeks, lambda key: (ALL_SITES, 'all', None)))
+
+    if by_site:
+        if 'day' in windows:
+            slices.update(site_days)
+        if 'week' in windows or 'all' in windows:
+            site_weeks = group(site_days, lambda key: (key[0], 'week', window_start(key[2], 'week')))
+            if 'week' in windows:
+                slices.update(site_weeks)
+            if 'all' in windows:
+                slices.update(group(site_weeks, lambda key: (key[0], 'all', None)))
+
+    return slices
+
+
+def slice_dir(output_root, site, window, start):
+    return os.path.join(output_root, site, window, 'all' if start is None else start.strftime('%Y-%m-%d'))
+
+
+def write_slice_report(aggregates, output_dir, slice_name):
+    """Виконується в окремому процесі: графіки, тексти і звіт однієї вибірки."""
+    os.makedirs(output_dir, exist_ok=True)
+    figures = aggregates.figures()
+    summary = aggregates.summary()
+    summary['slice'] = slice_name
+
+    report_path = generate_markdown_report(None, figures, aggregates.texts(), summary=summary, output_dir=output_dir)
+    for fig in figures.values():
+        plt.close(fig)
+    return report_path
+
+
+def write_reports(slices, output_root, workers=None, min_articles=1):
+    tasks = []
+    for (site, window, start), aggregates in sorted(slices.items(), key=lambda item: str(item[0])):
+        if aggregates.n_articles < min_articles:
+            continue
+        period = 'весь період' if start is None else f"{WINDOW_NAMES[window]} з {start.strftime('%Y-%m-%d')}"
+        tasks.append((aggregates, slice_dir(output_root, site, window, start), f"{site}, {period}"))
+
+    # Помилка однієї вибірки не зупиняє решту: її звіт пропускається, інші дописуються
+    report_paths = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(executor.submit(write_slice_report, *task), task[2]) for task in tasks]
+        for future, slice_name in futures:
+            try:
+                report_paths.append(future.result())
+            except Exception as e:
+                print(f"Звіт для вибірки «{slice_name}» не записано: {e!r}")
+    return report_paths
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Звіти для кожного сайту і вікна дат з одного обробленого корпусу")
+    arg_parser.add_argument('--input', default='processed_articles.parquet',
+                            help="Оброблений корпус з python main.py preprocess")
+    arg_parser.add_argument('--output-dir', default='batch_reports')
+    arg_parser.add_argument('--windows', default=','.join(WINDOWS), help="Вікна через кому: day, week, all")
+    arg_parser.add_argument('--no-sites', action='store_true', help="Лише звіти по всіх сайтах разом")
+    arg_parser.add_argument('--min-articles', type=int, default=1, help="Не писати звіти для менших вибірок")
+    arg_parser.add_argument('--workers', type=int, help="Процесів для побудови звітів (за замовчуванням — усі ядра)")
+    arg_parser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'],
+                            help="Нормалізувати словник маніпулятивних виразів цим лематизатором "
+                                 "(за замовчуванням — тим, яким оброблено корпус)")
+    arg_parser.add_argument('--stop-words', default='data/ukrainian_stopwords.txt')
+    arg_parser.add_argument('--tone-dict', default='data/tone_dict_uk.tsv')
+    arg_parser.add_argument('--manipulation-words', default='data/manipulation_words.txt')
+    arg_parser.add_argument('--duplicate-threshold', type=float, default=0.9)
+    args = arg_parser.parse_args()
+
+    windows = [window.strip() for window in args.windows.split(',')]
+    unknown = sorted(set(windows) - set(WINDOWS))
+    if unknown:
+        arg_parser.error(f"невідомі вікна: {', '.join(unknown)}")
+
+    lemmatizer = args.lemmatizer or load_processed_lemmatizer(args.input)
+    preprocess = make_preprocessor(lemmatizer, args.stop_words) if lemmatizer else None
+    manipulative_automaton = PhraseAutomaton(load_manipulative_phrases(args.manipulation_words, preprocess))
+
+    start = time.perf_counter()
+    news_df = enrich_processed(load_processed_articles(args.input), load_ner_model(),
+                               load_sentiment_analyzer(args.tone_dict), manipulative_automaton)
+    print(f'Підготовлено {len(news_df)} статей за {time.perf_counter() - start:.1f} с')
+
+    start = time.perf_counter()
+    cells = aggregate_cells(news_df, args.duplicate_threshold, len(manipulative_automaton))
+    slices = build_slices(cells, windows, not args.no_sites, args.duplicate_threshold, len(manipulative_automaton))
+    print(f'{len(cells)} клітинок (сайт × день) і {len(slices)} вибірок за {time.perf_counter() - start:.1f} с')
+
+    start = time.perf_counter()
+    report_paths = write_reports(slices, args.output_dir, args.workers, args.min_articles)
+    print(f'Записано {len(report_paths)} звітів у {args.output_dir} за {time.perf_counter() - start:.1f} с')
+
+
+if __name__ == "__main__":
+    main()
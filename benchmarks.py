@@ -0,0 +1,255 @@
+"""
+Заміри швидкодії окремих частин аналізу.
+
+lemmatizers — порівняння повного пайплайну spaCy і легкого режиму pymorphy3:
+час обробки, статті за секунду, влучання в кеш лем та узгодженість результатів.
+Узгодженість рахуємо як F1 між мультимножинами лем кожної статті (усереднено по статтях).
+
+csv-load — читання корпусу старим шляхом (pandas C-рідер, string на Python-об'єктах, to_datetime)
+проти pyarrow (load_articles): час, пам'ять датафрейму і пікова пам'ять процесу, а також очистка
+тексту re.sub через .apply проти clean_text_column. Кожен варіант запускається в окремому процесі,
+щоб пікова пам'ять не змішувалась. Якщо файлу немає, генерується синтетичний корпус заданого розміру.
+
+startup — час імпорту модулів і старту команд main.py у свіжому інтерпретаторі (мінус порожній
+запуск Python) та найважчі залежності кожного модуля за python -X importtime.
+
+Приклади:
+    python benchmarks.py lemmatizers --csv parsed_articles.csv --sample 500
+    python benchmarks.py csv-load --csv /tmp/corpus_1gb.csv --size-mb 1024
+    python benchmarks.py startup --run "main.py report"
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+
+
+def lemma_agreement(tokens_a, tokens_b):
+    """F1 між мультимножинами лем двох режимів для однієї статті."""
+    if not tokens_a and not tokens_b:
+        return 1.0
+    common = sum((Counter(tokens_a) & Counter(tokens_b)).values())
+    return 2 * common / (len(tokens_a) + len(tokens_b))
+
+
+def benchmark_lemmatizers(texts, stop_words_path):
+    from tools import load_preprocess_model, preprocess_text, MorphLemmatizer, load_stop_words, preprocess_text_morph
+
+    nlp_preprocess = load_preprocess_model(stop_words_path)
+    lemmatizer = MorphLemmatizer(load_stop_words(stop_words_path))
+
+    start = time.perf_counter()
+    spacy_tokens = [preprocess_text(text, nlp_preprocess) for text in texts]
+    spacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    morph_tokens = [preprocess_text_morph(text, lemmatizer) for text in texts]
+    morph_seconds = time.perf_counter() - start
+
+    agreements = [lemma_agreement(a, b) for a, b in zip(spacy_tokens, morph_tokens)]
+    cache_info = lemmatizer.lemmatize.cache_info()
+
+    return {
+        'n_texts': len(texts),
+        'spacy_seconds': spacy_seconds,
+        'pymorphy_seconds': morph_seconds,
+        'speedup': spacy_seconds / morph_seconds if morph_seconds else float('inf'),
+        'agreement': sum(agreements) / len(agreements) if agreements else 1.0,
+        'cache_hit_ratio': cache_info.hits / max(cache_info.hits + cache_info.misses, 1),
+        'cache_size': cache_info.currsize,
+    }
+
+
+def make_synthetic_corpus(csv_path, size_mb, seed=42):
+    """Корпус зі структурою parsed_articles.csv, складений зі слів наявних словників."""
+    import csv
+    import random
+    from datetime import datetime, timedelta
+
+    with open('data/tone_dict_uk.tsv', 'r', encoding='utf-8') as f:
+        vocabulary = [line.split('\t')[0] for line in f if line.strip()]
+
+    rng = random.Random(seed)
+    start_date = datetime(2024, 11, 1)
+    target_bytes = size_mb * 1024 * 1024
+
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(['title', 'date', 'text', 'url'])
+        i = 0
+        while f.tell() < target_bytes:
+            text = ' '.join(rng.choices(vocabulary, k=rng.randint(150, 600))) + '.'
+            writer.writerow([
+                ' '.join(rng.choices(vocabulary, k=8)),
+                (start_date + timedelta(minutes=rng.randint(0, 90 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S'),
+                text,
+                f'https://example.com/news/{i}',
+            ])
+            i += 1
+
+
+def _peak_rss_mb():
+    # На Linux ru_maxrss у кілобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_csv_load(csv_path, variant):
+    import pandas as pd
+
+    start = time.perf_counter()
+    if variant == 'python':
+        # Явно python-рядки: так працює dtype='string' у pandas 2.x, з якого починали
+        dtypes = {column: pd.StringDtype('python') for column in ['title', 'url', 'date', 'text']}
+        news_df = pd.read_csv(csv_path, dtype=dtypes)
+        news_df['date'] = pd.to_datetime(news_df['date'])
+    else:
+        from tools import load_articles
+        news_df = load_articles(csv_path)
+    load_seconds = time.perf_counter() - start
+    load_peak_rss_mb = _peak_rss_mb()
+
+    frame_mb = news_df.memory_usage(deep=True).sum() / 1024 / 1024
+
+    # Очистка тексту тим самим шляхом, яким її робить відповідний варіант
+    start = time.perf_counter()
+    if variant == 'python':
+        import re
+        news_df['text'].apply(lambda text: re.sub(r'[^\w\s]', ' ', text).lower().strip())
+    else:
+        from tools import clean_text_column
+        clean_text_column(news_df['text'])
+    clean_seconds = time.perf_counter() - start
+
+    return {
+        'variant': variant,
+        'rows': len(news_df),
+        'load_seconds': load_seconds,
+        'clean_seconds': clean_seconds,
+        'frame_mb': frame_mb,
+        'load_peak_rss_mb': load_peak_rss_mb,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _run_seconds(argv, repeats):
+    """Медіана часу виконання команди в окремому процесі."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def heaviest_imports(module, top=5):
+    """Найважчі прямі залежності модуля: (назва, кумулятивний час у секундах) з -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True).stderr
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1e6))
+
+    # Залежності друкуються перед модулем з більшим відступом; імпорти самого інтерпретатора
+    # (site, .pth) стоять вище на тому ж рівні, що й модуль, і відсікаються
+    end = max(i for i, (_, name, _) in enumerate(imports) if name == module)
+    module_level = imports[end][0]
+    start = end
+    while start > 0 and imports[start - 1][0] > module_level:
+        start -= 1
+    direct = [(name, seconds) for level, name, seconds in imports[start:end] if level == module_level + 2]
+    return sorted(direct, key=lambda item: item[1], reverse=True)[:top]
+
+
+def measure_startup(modules, commands, repeats=5):
+    baseline = _run_seconds(['-c', 'pass'], repeats)
+    results = []
+    for module in modules:
+        results.append({
+            'name': f'import {module}',
+            'seconds': _run_seconds(['-c', f'import {module}'], repeats) - baseline,
+            'heaviest': heaviest_imports(module),
+        })
+    for command in commands:
+        results.append({
+            'name': command,
+            'seconds': _run_seconds(command.split(), repeats) - baseline,
+            'heaviest': [],
+        })
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Заміри швидкодії аналізу новин")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    lemmatizers_parser = subparsers.add_parser('lemmatizers', help="spaCy проти pymorphy3")
+    lemmatizers_parser.add_argument('--csv', default='parsed_articles.csv')
+    lemmatizers_parser.add_argument('--sample', type=int, default=500)
+    lemmatizers_parser.add_argument('--stop-words', default='data/ukrainian_stopwords.txt')
+
+    csv_load_parser = subparsers.add_parser('csv-load', help="pandas C-рідер проти pyarrow")
+    csv_load_parser.add_argument('--csv', default='synthetic_corpus.csv')
+    csv_load_parser.add_argument('--size-mb', type=int, default=1024, help="Розмір синтетичного корпусу")
+    csv_load_parser.add_argument('--variant', choices=['python', 'pyarrow'], help=argparse.SUPPRESS)
+
+    startup_parser = subparsers.add_parser('startup', help="Час імпорту модулів і старту команд")
+    startup_parser.add_argument('--modules', default='report_generator,main,tools,aggregates,service',
+                                help="Модулі через кому")
+    startup_parser.add_argument('--run', dest='commands', action='append', default=[],
+                                help="Команда для заміру, наприклад \"main.py report\" (можна кілька)")
+    startup_parser.add_argument('--repeats', type=int, default=5)
+
+    args = arg_parser.parse_args()
+
+    if args.command == 'lemmatizers':
+        import pandas as pd
+
+        news_df = pd.read_csv(args.csv, dtype='string').dropna(subset=['text'])
+        texts = news_df['text'].sample(min(args.sample, len(news_df)), random_state=42).tolist()
+
+        result = benchmark_lemmatizers(texts, args.stop_words)
+        print(f"Статей: {result['n_texts']}")
+        print(f"spaCy:    {result['spacy_seconds']:.2f} с ({result['n_texts'] / result['spacy_seconds']:.1f} статей/с)")
+        print(f"pymorphy: {result['pymorphy_seconds']:.2f} с ({result['n_texts'] / result['pymorphy_seconds']:.1f} статей/с)")
+        print(f"Прискорення: x{result['speedup']:.1f}")
+        print(f"Узгодженість лем (F1): {result['agreement']:.3f}")
+        print(f"Влучання в кеш лем: {result['cache_hit_ratio']:.1%} ({result['cache_size']} словоформ)")
+
+    elif args.command == 'csv-load':
+        if args.variant:
+            # Дочірній процес: один варіант, результат у stdout
+            print(json.dumps(measure_csv_load(args.csv, args.variant)))
+            return
+
+        if not os.path.exists(args.csv):
+            print(f"Генеруємо синтетичний корпус {args.size_mb} МБ у {args.csv}")
+            make_synthetic_corpus(args.csv, args.size_mb)
+        print(f"Файл: {args.csv}, {os.path.getsize(args.csv) / 1024 / 1024:.0f} МБ")
+
+        for variant in ['python', 'pyarrow']:
+            output = subprocess.run(
+                [sys.executable, __file__, 'csv-load', '--csv', args.csv, '--variant', variant],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant:8s} рядків: {result['rows']}, читання: {result['load_seconds']:.1f} с, "
+                  f"очистка тексту: {result['clean_seconds']:.1f} с, датафрейм: {result['frame_mb']:.0f} МБ, "
+                  f"пік після читання: {result['load_peak_rss_mb']:.0f} МБ, пік після очистки: {result['peak_rss_mb']:.0f} МБ")
+
+    elif args.command == 'startup':
+        commands = ['main.py --help'] + args.commands
+        for result in measure_startup(args.modules.split(','), commands, args.repeats):
+            heaviest = ', '.join(f'{name} {seconds:.2f} с' for name, seconds in result['heaviest'])
+            print(f"{result['name']:30s} {result['seconds']:.2f} с" + (f"  ({heaviest})" if heaviest else ''))
+
+
+if __name__ == "__main__":
+    main()
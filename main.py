@@ -9,111 +9,335 @@
 Для аналізу тональності будемо використовувати VADER і pymorphy2 для морфологічного аналізу
 української мови:
 https://github.com/kmike/pymorphy2.git
+
+Кроки запускаються окремими командами, кожна зі своїми шляхами:
+    python main.py crawl --output parsed_articles.csv
+    python main.py preprocess --articles parsed_articles.csv --output processed_articles.parquet
+    python main.py analyze --input processed_articles.parquet --only sentiment,ner
+    python main.py report --results analysis_results.json
+    python main.py run                      # усе одразу в одному процесі
+Лематизацію можна робити повним пайплайном spaCy (за замовчуванням) або легким режимом
+regex-токенізатор + pymorphy3: --lemmatizer pymorphy
+Для корпусів, що не вміщуються в пам'ять, є поблочний режим: python main.py run --chunk-size 5000
+
+Важкі бібліотеки (spaCy, sklearn, matplotlib, nltk...) імпортуються всередині команд, яким вони
+потрібні, тому report і analyze --only стартують швидко. Заміри: python benchmarks.py startup
 """
+import argparse
+import json
+import os
+
+ARTICLES_PATH = 'parsed_articles.csv'
+PROCESSED_PATH = 'processed_articles.parquet'
+RESULTS_PATH = 'analysis_results.json'
+STOP_WORDS_PATH = 'data/ukrainian_stopwords.txt'
+TONE_DICT_PATH = 'data/tone_dict_uk.tsv'
+MANIPULATION_WORDS_PATH = 'data/manipulation_words.txt'
+VECTOR_STORE_DIR = 'vector_store'
+
+# Аналізи в порядку звіту (назви для analyze --only)
+ANALYSES = [
+    'publication', 'words', 'sentiment', 'ner', 'cooccurrence',
+    'repackaged', 'semantic', 'title_similarity', 'manipulation'
+]
 
-from tools import *
-from report_generator import generate_markdown_report
-import spacy
-
-
-
-def main():
-    # ------------------------- Завантаження та формування моделей -------------------------
-
-    # Пайплайн для попередньої обробки (з лемантизацією)
-    try:
-        nlp_preprocess = spacy.load("uk_core_news_lg")
-    except OSError:
-        import subprocess
-        import sys
-        subprocess.run([sys.executable, "-m", "spacy", "download", "uk_core_news_lg"])
-        nlp_preprocess = spacy.load("uk_core_news_lg")
-
-    # Відключаємо ВСЕ окрім токенізатора та лематизатора
-    pipes_to_disable = []
-    for name, _ in nlp_preprocess.pipeline:
-        if name not in ['tok2vec', 'lemmatizer']:  # Потрібні для лематизації
-            pipes_to_disable.append(name)
-    print(f"Відключаємо пайпи: {pipes_to_disable}")
-    nlp_preprocess.disable_pipes(*pipes_to_disable)
-
-    # Завантажуємо стоп-слова
-    with open('/kaggle/input/ukrainian-stoop-words/ukrainian_stopwords.txt', 'r', encoding='utf-8') as f:
-        custom_stop_words = set(line.strip() for line in f)
-        # Додаємо кастомні стоп-слова до стандартних стоп-слів spaCy
-        for word in custom_stop_words:
-            nlp_preprocess.vocab[word].is_stop = True
-
-    # Пайплайн для NER
-    nlp_ner = spacy.load("uk_core_news_lg")
-    nlp_ner.disable_pipes(["tok2vec", "morphologizer", "lemmatizer", "attribute_ruler"])
-
-
-    # ------------------------- Обробка даних -------------------------
-    dtypes = {
-        'title': 'string',
-        'url': 'string',
-        'date': 'string',
-        'text': 'string'
-    }
-
-    news_df = pd.read_csv('/kaggle/input/parsed-ukrainian-news/parsed_articles.csv', dtype=dtypes)
-    news_df['date'] = pd.to_datetime(news_df['date'])
+
+def preprocess_articles(articles_path, preprocess):
+    from tools import load_articles, clean_text_column
+
+    # pyarrow CSV-рідер: string[pyarrow] колонки і дата, розпарсена при читанні
+    news_df = load_articles(articles_path)
     print('Dataset loaded')
 
-    news_df['processed_title'] = news_df['title'].apply(lambda x: preprocess_text(x, nlp_preprocess))
+    news_df['processed_title'] = clean_text_column(news_df['title']).apply(lambda x: preprocess(x, cleaned=True))
     print('Titles processed')
 
-    news_df['processed_text'] = news_df['text'].apply(lambda x: preprocess_text(x, nlp_preprocess))
+    # Потік лем зі стоп-словами (lemma_stream) потрібен для пошуку маніпулятивних виразів
+    processed = clean_text_column(news_df['text']).apply(lambda x: preprocess(x, cleaned=True, with_stream=True))
+    news_df['processed_text'] = processed.map(lambda pair: pair[0])
+    news_df['lemma_stream'] = processed.map(lambda pair: pair[1])
+    del processed
     print('Texts processed')
 
-    news_df = news_df.dropna().reset_index(drop=True)
+    return news_df.dropna().reset_index(drop=True)
 
-    gc.collect()
 
-    # ------------------------- Аналіз даних -------------------------
+def run_analyses(news_df, only=ANALYSES, tone_dict_path=TONE_DICT_PATH,
+                 manipulation_words_path=MANIPULATION_WORDS_PATH, vector_store_dir=VECTOR_STORE_DIR,
+                 preprocess=None):
+    """
+    Запускає вибрані аналізи над обробленим корпусом і повертає (figures, texts) для звіту.
+    preprocess потрібен лише для нормалізації словника маніпулятивних виразів (тим самим
+    лематизатором, що й корпус); без нього словник вважається вже лематизованим.
+    """
+    import gc
+    import tools
+
+    figures, texts = {}, {}
 
     # Аналіз частоти публікацій новин
-    publication_freq_figure = freq_of_publication_analysis(news_df)
+    if 'publication' in only:
+        figures['publication_freq'] = tools.freq_of_publication_analysis(news_df)
 
     # Аналіз найчастіше вживаних слів (word cloud)
-    word_freq_cloud = words_freq_analysis(news_df)
+    if 'words' in only:
+        figures['wordcloud'] = tools.words_freq_analysis(news_df)
 
     # Аналіз тональності(VADER)
-    tonality_hist, average_tonality_over_time = tonality_analysis_VADER(news_df, nlp_preprocess)
+    if 'sentiment' in only:
+        figures['all_tonality'], figures['tonality_per_time'] = tools.tonality_analysis_VADER(
+            news_df, tone_dict_path=tone_dict_path
+        )
+
+    # Пайплайн для NER (його вектори uk_core_news_lg використовує і пошук перефразованих новин)
+    if {'ner', 'cooccurrence', 'semantic'} & set(only):
+        nlp_ner = tools.load_ner_model()
 
     # Аналіз та візуалізація ключових осіб та подій
-    named_ent_freq_cloud = extract_and_visualize_named_entities(news_df, nlp_ner)
+    if 'ner' in only:
+        figures['ner_visualization'] = tools.extract_and_visualize_named_entities(news_df, nlp_ner)
+
+    # Мережа спільних згадувань сутностей (використовує колонку entities з попереднього кроку)
+    if 'cooccurrence' in only:
+        if 'entities' not in news_df:
+            news_df['entities'] = news_df['processed_text'].apply(
+                lambda tokens: tools.extract_entities(" ".join(tokens), nlp_ner)
+            )
+        figures['entity_cooccurrence'], texts['entity_cooccurrence'] = tools.entity_cooccurrence_analysis(news_df)
 
     # Виявлення перепакованих (копіпаст) новин
-    copypast_freq_hist, copypast_examples = detect_repackaged_news(news_df)
+    if 'repackaged' in only:
+        figures['repackaged_news'], texts['repackaged_news'] = tools.detect_repackaged_news(news_df)
+
+    # Виявлення перефразованих новин за векторами документів
+    if 'semantic' in only:
+        from semantic_duplicates import detect_semantic_duplicates
+        figures['semantic_duplicates'], texts['semantic_duplicates'] = detect_semantic_duplicates(
+            news_df, nlp_ner.vocab, vector_store_dir
+        )
 
     # Виявлення клікбейтних заголовків
-    cosine_similarity_freq, click_bait_text = analyze_title_text_similarity(news_df)
+    if 'title_similarity' in only:
+        figures['title_text_similarity'], texts['title_text_similarity'] = \
+            tools.analyze_title_text_similarity(news_df)
 
     # Виявлення маніпулятивності в новинах
-    man_part_freq, man_part_text = analyze_manipulative_language(news_df, "/kaggle/input/ukrainian-manipulation-words/Manipulation words.txt")
-
-    figures = {
-        'publication_freq': publication_freq_figure,
-        'wordcloud': word_freq_cloud,
-        'all_tonality': tonality_hist,
-        'tonality_per_time': average_tonality_over_time,
-        'ner_visualization': named_ent_freq_cloud,
-        'repackaged_news': copypast_freq_hist,
-        'title_text_similarity': cosine_similarity_freq,
-        'manipulative_language': man_part_freq
-    }
-
-    text_results = {
-        'repackaged_news': copypast_examples,
-        'title_text_similarity': click_bait_text,
-        'manipulative_language': man_part_text
-    }
+    if 'manipulation' in only:
+        figures['manipulative_language'], texts['manipulative_language'] = tools.analyze_manipulative_language(
+            news_df, manipulation_words_path, preprocess
+        )
+
+    gc.collect()
+
+    return figures, texts
+
+
+def main(lemmatizer='spacy', articles_path=ARTICLES_PATH, stop_words_path=STOP_WORDS_PATH,
+         tone_dict_path=TONE_DICT_PATH, manipulation_words_path=MANIPULATION_WORDS_PATH,
+         vector_store_dir=VECTOR_STORE_DIR):
+    from tools import make_preprocessor
+    from report_generator import generate_markdown_report
+
+    # Функція лематизації (spaCy або pymorphy3) з кастомними стоп-словами
+    preprocess = make_preprocessor(lemmatizer, stop_words_path)
+
+    news_df = preprocess_articles(articles_path, preprocess)
+
+    figures, text_results = run_analyses(news_df, ANALYSES, tone_dict_path, manipulation_words_path,
+                                         vector_store_dir, preprocess)
 
     generate_markdown_report(news_df, figures, text_results)
 
 
+def main_chunked(lemmatizer='spacy', chunk_size=5000, detect_duplicates=False, articles_path=ARTICLES_PATH,
+                 stop_words_path=STOP_WORDS_PATH, tone_dict_path=TONE_DICT_PATH,
+                 manipulation_words_path=MANIPULATION_WORDS_PATH):
+    """
+    Поблочний режим: корпус читається порціями по chunk_size статей, кожна порція
+    обробляється і згортається в AnalysisAggregates, після чого відкидається.
+    Пікова пам'ять залежить від розміру порції, а не від розміру корпусу.
+    Мережа спільних згадувань у цьому режимі не будується. Пошук копіпасту вмикається
+    окремо (detect_duplicates): його стан і кількість порівнянь ростуть з розміром корпусу.
+    """
+    import gc
+    from tools import (
+        make_preprocessor, load_ner_model, load_sentiment_analyzer, load_manipulative_phrases, PhraseAutomaton,
+        iter_article_batches
+    )
+    from aggregates import AnalysisAggregates, enrich_batch
+    from report_generator import generate_markdown_report
+
+    preprocess = make_preprocessor(lemmatizer, stop_words_path)
+    nlp_ner = load_ner_model()
+    SIA = load_sentiment_analyzer(tone_dict_path)
+    manipulative_automaton = PhraseAutomaton(load_manipulative_phrases(manipulation_words_path, preprocess))
+
+    aggregates = AnalysisAggregates(duplicate_threshold=0.9 if detect_duplicates else None,
+                                    manipulative_dictionary_size=len(manipulative_automaton))
+
+    for i, batch in enumerate(iter_article_batches(articles_path, batch_rows=chunk_size), start=1):
+        aggregates.update(enrich_batch(batch, preprocess, nlp_ner, SIA, manipulative_automaton))
+        del batch
+        gc.collect()
+        print(f'Порція {i} оброблена, всього {aggregates.n_articles} статей')
+
+    generate_markdown_report(None, aggregates.figures(), aggregates.texts(), summary=aggregates.summary())
+
+
+# ------------------------- Команди CLI -------------------------
+def _use_agg_backend():
+    # Графіки лише зберігаються у файли, вікна не потрібні
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _parse_analyses(value):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(ANALYSES))
+    if unknown:
+        raise argparse.ArgumentTypeError(f"невідомі аналізи: {', '.join(unknown)} (доступні: {', '.join(ANALYSES)})")
+    return names
+
+
+def crawl_command(args):
+    from parser import parse_all_sites
+    parse_all_sites(csv_path=args.output)
+
+
+def preprocess_command(args):
+    from tools import make_preprocessor, save_processed_articles
+
+    news_df = preprocess_articles(args.articles, make_preprocessor(args.lemmatizer, args.stop_words))
+    save_processed_articles(news_df, args.output, args.lemmatizer)
+    print(f'Оброблено {len(news_df)} статей, збережено в {args.output}')
+
+
+def analyze_command(args):
+    """
+    Результати (шляхи до графіків, тексти і загальні показники) дописуються в JSON,
+    тож кілька запусків analyze --only поступово наповнюють один звіт.
+    """
+    _use_agg_backend()
+    import matplotlib.pyplot as plt
+    from tools import load_processed_articles, load_processed_lemmatizer, make_preprocessor
+    from report_generator import save_figure, summarize_dataframe
+
+    news_df = load_processed_articles(args.input)
+    print(f'Завантажено {len(news_df)} оброблених статей')
+
+    # Словник лематизується тим самим режимом, що й корпус, інакше вирази з нього не збігаються
+    preprocess = None
+    if 'manipulation' in args.only:
+        lemmatizer = args.lemmatizer or load_processed_lemmatizer(args.input)
+        if lemmatizer:
+            preprocess = make_preprocessor(lemmatizer, args.stop_words)
+        else:
+            print("Невідомо, яким лематизатором оброблено корпус: словник маніпуляцій вважається "
+                  "вже лематизованим (вкажіть --lemmatizer)")
+    figures, texts = run_analyses(news_df, args.only, args.tone_dict, args.manipulation_words,
+                                  args.vector_store, preprocess)
+
+    results = {'summary': {}, 'figures': {}, 'texts': {}}
+    if os.path.exists(args.results):
+        with open(args.results, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+
+    os.makedirs("reports", exist_ok=True)
+    for name, fig in figures.items():
+        results['figures'][name] = save_figure(fig, f"{name}.png")
+        plt.close(fig)
+    results['texts'].update(texts)
+
+    summary = summarize_dataframe(news_df)
+    results['summary'].update({
+        'n_articles': summary['n_articles'],
+        'date_min': str(summary['date_min']),
+        'date_max': str(summary['date_max']),
+    })
+    if 'mean_sentiment' in summary:
+        results['summary']['mean_sentiment'] = float(summary['mean_sentiment'])
+
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Аналізи {', '.join(args.only)} збережено в {args.results}")
+
+
+def report_command(args):
+    from report_generator import render_markdown_report, write_markdown_report
+
+    with open(args.results, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+
+    report_path = write_markdown_report(
+        render_markdown_report(results['figures'], results['texts'], results['summary']), args.output
+    )
+    print(f'Звіт збережено в {report_path}')
+
+
+def run_command(args):
+    _use_agg_backend()
+    if args.chunk_size:
+        main_chunked(lemmatizer=args.lemmatizer, chunk_size=args.chunk_size,
+                     detect_duplicates=args.duplicates, articles_path=args.articles,
+                     stop_words_path=args.stop_words, tone_dict_path=args.tone_dict,
+                     manipulation_words_path=args.manipulation_words)
+    else:
+        main(lemmatizer=args.lemmatizer, articles_path=args.articles, stop_words_path=args.stop_words,
+             tone_dict_path=args.tone_dict, manipulation_words_path=args.manipulation_words,
+             vector_store_dir=args.vector_store)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Аналіз новин")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    crawl_parser = subparsers.add_parser('crawl', help="Спарсити статті з сайтів")
+    crawl_parser.add_argument('--output', default=ARTICLES_PATH)
+    crawl_parser.set_defaults(func=crawl_command)
+
+    preprocess_parser = subparsers.add_parser('preprocess', help="Лематизувати корпус і зберегти в parquet")
+    preprocess_parser.add_argument('--articles', default=ARTICLES_PATH)
+    preprocess_parser.add_argument('--output', default=PROCESSED_PATH)
+    preprocess_parser.set_defaults(func=preprocess_command)
+
+    analyze_parser = subparsers.add_parser('analyze', help="Запустити аналізи над обробленим корпусом")
+    analyze_parser.add_argument('--input', default=PROCESSED_PATH)
+    analyze_parser.add_argument('--only', type=_parse_analyses, default=ANALYSES,
+                                help=f"Аналізи через кому: {', '.join(ANALYSES)}")
+    analyze_parser.add_argument('--results', default=RESULTS_PATH)
+    analyze_parser.set_defaults(func=analyze_command)
+
+    report_parser = subparsers.add_parser('report', help="Згенерувати звіт зі збережених результатів")
+    report_parser.add_argument('--results', default=RESULTS_PATH)
+    report_parser.add_argument('--output', default='news_analysis_report.md')
+    report_parser.set_defaults(func=report_command)
+
+    run_parser = subparsers.add_parser('run', help="Увесь пайплайн в одному процесі")
+    run_parser.add_argument('--articles', default=ARTICLES_PATH)
+    run_parser.add_argument('--chunk-size', type=int,
+                            help="Обробляти корпус порціями по N статей (для корпусів, більших за пам'ять)")
+    run_parser.add_argument('--duplicates', action='store_true',
+                            help="У поблочному режимі шукати й копіпаст (його пам'ять і час ростуть з кількістю "
+                                 "статей, а не з розміром порції)")
+    run_parser.set_defaults(func=run_command)
+
+    # Спільні параметри моделей і словників
+    for subparser in [preprocess_parser, analyze_parser, run_parser]:
+        subparser.add_argument('--stop-words', default=STOP_WORDS_PATH)
+    for subparser in [preprocess_parser, run_parser]:
+        subparser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'], default='spacy',
+                               help="Режим лематизації: повний пайплайн spaCy або regex + pymorphy3")
+    analyze_parser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'],
+                                help="Нормалізувати словник маніпулятивних виразів цим лематизатором "
+                                     "(за замовчуванням — тим, яким оброблено корпус)")
+    for subparser in [analyze_parser, run_parser]:
+        subparser.add_argument('--tone-dict', default=TONE_DICT_PATH)
+        subparser.add_argument('--manipulation-words', default=MANIPULATION_WORDS_PATH)
+        subparser.add_argument('--vector-store', default=VECTOR_STORE_DIR)
+
+    return arg_parser
+
 
 if __name__ == "__main__":
-    main()
+    args = build_arg_parser().parse_args()
+    args.func(args)
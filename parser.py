@@ -315,21 +315,48 @@ def parse_korrespondent():
     return news_df
 
 
-def parse_all_sites():
-    ukr_pravda_df = parse_ukr_pravda()
-    babel_df = parse_babel()
-    rbc_df = parse_rbc()
-    korrespondent_df = parse_korrespondent()
+def parse_all_sites(on_batch=None, csv_path='parsed_articles.csv'):
+    """
+    Парсить усі сайти і зберігає результат у csv_path (за замовчуванням parsed_articles.csv).
+    on_batch(df) викликається одразу після парсингу кожного сайту, щоб сервіс
+    інкрементального аналізу (service.py) міг обробляти статті не чекаючи кінця парсингу.
+    """
+    site_dfs = []
+    for parse_site in [parse_ukr_pravda, parse_babel, parse_rbc, parse_korrespondent]:
+        site_df = parse_site()
+        site_dfs.append(site_df)
+        if on_batch is not None and not site_df.empty:
+            on_batch(site_df)
+
+    all_articles_df = pd.concat(site_dfs, axis=0, ignore_index=True)
+    save_articles(all_articles_df, csv_path)
 
-    all_articles_df = pd.concat([ukr_pravda_df, babel_df, rbc_df, korrespondent_df], axis=0, ignore_index=True)
-    all_articles_df['text'] = all_articles_df['text'].str.replace(r'[\n\t\r]', ' ', regex=True)
+    print(f'\nВсього за період в {days_to_parse} було знайдено {all_articles_df.shape[0]}')
 
-    all_articles_df.to_csv('parsed_articles.csv',
-                           index=False,
-                           encoding='utf-8',
-                           quoting=1)
 
-    print(f'\nВсього за період в {days_to_parse} було знайдено {all_articles_df.shape[0]}')
+def save_articles(articles_df, csv_path):
+    """
+    Зберігає статті через pyarrow: переноси рядків у тексті замінюються Arrow compute kernel-ом,
+    а всі значення беруться в лапки (як quoting=1 у pandas). Дата пишеться з точністю до секунди,
+    незалежно від одиниці datetime64 у поточній версії pandas.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv as pa_csv
+
+    articles_df = articles_df[['title', 'date', 'text', 'url']].copy()
+    articles_df['date'] = pd.to_datetime(articles_df['date'])
+    table = pa.Table.from_pandas(articles_df.astype({'title': 'string', 'text': 'string', 'url': 'string'}),
+                                 preserve_index=False)
+
+    date_index = table.schema.get_field_index('date')
+    table = table.set_column(date_index, 'date', table['date'].cast(pa.timestamp('s'), safe=False))
+
+    text_index = table.schema.get_field_index('text')
+    table = table.set_column(text_index, 'text', pc.replace_substring_regex(table['text'], r'[\n\t\r]', ' '))
+
+    pa_csv.write_csv(table, csv_path, write_options=pa_csv.WriteOptions(quoting_style='all_valid'))
 
 
-parse_all_sites()
+if __name__ == "__main__":
+    parse_all_sites()
@@ -2,106 +2,172 @@ import os
 import datetime
 
 
-def save_figure(fig, filename):
-    """Зберігає графік у файл."""
+def save_figure(fig, filename, output_dir="."):
+    """Зберігає графік у output_dir/reports і повертає шлях відносно output_dir (для посилання у звіті)."""
     fig_path = os.path.join("reports", filename)
-    fig.savefig(fig_path, format='png', bbox_inches='tight')
+    fig.savefig(os.path.join(output_dir, fig_path), format='png', bbox_inches='tight')
     return fig_path
 
-def generate_markdown_report(df, figures, texts):
+def summarize_dataframe(df):
+    """Загальні показники для шапки звіту."""
+    summary = {
+        'n_articles': len(df),
+        'date_min': df['date'].min(),
+        'date_max': df['date'].max(),
+    }
+    if 'sentiment_score' in df:
+        summary['mean_sentiment'] = df['sentiment_score'].mean()
+    return summary
+
+
+def _format_date(value):
+    # Timestamp з датафрейму або рядок з analysis_results.json
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else str(value)[:10]
+
+
+def generate_markdown_report(df, figures, texts, summary=None, output_dir="."):
     """
     Генерує Markdown-звіт із результатами аналізу новин.
 
     Parameters:
     -----------
     df : pandas DataFrame
-        Датафрейм із новинами.
+        Датафрейм із новинами. Може бути None, якщо передано summary.
     figures : dict
         Словник із matplotlib figures.
     texts: dict
         Словник із текстовими результатами аналізу.
+    summary: dict
+        Готові загальні показники (див. summarize_dataframe), коли звіт
+        будується з агрегованого стану без датафрейму.
+    output_dir: str
+        Каталог для news_analysis_report.md і reports/ (щоб звіти різних вибірок не перезаписували один одного).
     """
-    os.makedirs("reports", exist_ok=True)
+    if summary is None:
+        summary = summarize_dataframe(df)
+
+    os.makedirs(os.path.join(output_dir, "reports"), exist_ok=True)
 
     # Збереження графіків
     figure_paths = {
-        name: save_figure(fig, f"{name}.png")
+        name: save_figure(fig, f"{name}.png", output_dir)
         for name, fig in figures.items()
     }
 
-    # Створення тексту звіту
+    return write_markdown_report(render_markdown_report(figure_paths, texts, summary),
+                                 os.path.join(output_dir, "news_analysis_report.md"))
+
+
+def write_markdown_report(markdown_content, report_path="news_analysis_report.md"):
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(markdown_content)
+
+    return report_path
+
+
+def render_markdown_report(figure_paths, texts, summary):
+    """
+    Текст звіту з уже збережених графіків (figure_paths: назва -> шлях до png).
+    Не потребує matplotlib, тому звіт можна перегенерувати з analysis_results.json
+    (main.py report). Секції, яких немає в результатах, пропускаються.
+    """
     markdown_content = f"# Аналітичний звіт по новинам\n\n"
     markdown_content += f"**Дата створення:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-    markdown_content += f"**Проаналізовано новин:** {len(df)}\n\n"
-    markdown_content += f"**Період аналізу:** {df['date'].min().strftime('%Y-%m-%d')} - {df['date'].max().strftime('%Y-%m-%d')}\n\n"
-    markdown_content += f"**Середня тональність:** {df['sentiment_score'].mean():.2f}\n\n"
+    if summary.get('slice'):
+        markdown_content += f"**Вибірка:** {summary['slice']}\n\n"
+    markdown_content += f"**Проаналізовано новин:** {summary['n_articles']}\n\n"
+    markdown_content += f"**Період аналізу:** {_format_date(summary['date_min'])} - {_format_date(summary['date_max'])}\n\n"
+    if summary.get('mean_sentiment') is not None:
+        markdown_content += f"**Середня тональність:** {summary['mean_sentiment']:.2f}\n\n"
 
     # Секція: Частота публікацій
-    markdown_content += "## Частота публікацій\n"
-    markdown_content += (
-        "Цей графік відображає, як змінювалась кількість новин з часом. "
-        "Піки можуть свідчити про події, що привернули велику увагу ЗМІ, тоді як провали — про інформаційне затишшя.\n\n"
-    )
-    markdown_content += f"![Частота публікацій]({figure_paths['publication_freq']})\n\n"
+    if 'publication_freq' in figure_paths:
+        markdown_content += "## Частота публікацій\n"
+        markdown_content += (
+            "Цей графік відображає, як змінювалась кількість новин з часом. "
+            "Піки можуть свідчити про події, що привернули велику увагу ЗМІ, тоді як провали — про інформаційне затишшя.\n\n"
+        )
+        markdown_content += f"![Частота публікацій]({figure_paths['publication_freq']})\n\n"
 
     # Секція: Хмара слів
-    markdown_content += "## Хмара слів\n"
-    markdown_content += (
-        "Хмара слів показує, які лексеми найчастіше зустрічались у текстах новин. "
-        "Великі слова — часті, дрібні — рідкісні. Це дозволяє побачити основну тематику публікацій.\n\n"
-    )
-    markdown_content += f"![Хмара слів]({figure_paths['wordcloud']})\n\n"
+    if 'wordcloud' in figure_paths:
+        markdown_content += "## Хмара слів\n"
+        markdown_content += (
+            "Хмара слів показує, які лексеми найчастіше зустрічались у текстах новин. "
+            "Великі слова — часті, дрібні — рідкісні. Це дозволяє побачити основну тематику публікацій.\n\n"
+        )
+        markdown_content += f"![Хмара слів]({figure_paths['wordcloud']})\n\n"
 
     # Секція: Аналіз тональності
-    markdown_content += "## Аналіз тональності\n"
-    markdown_content += (
-        "Тональність — це оцінка емоційного забарвлення тексту (негативна, нейтральна, позитивна). "
-        "Розподіл показує загальну емоційну атмосферу в ЗМІ. Також аналіз подає, як змінювалась тональність із часом.\n\n"
-    )
-    markdown_content += f"![Аналіз тональності]({figure_paths['all_tonality']})\n\n"
-    markdown_content += f"![Тональність за часом]({figure_paths['tonality_per_time']})\n\n"
+    if 'all_tonality' in figure_paths:
+        markdown_content += "## Аналіз тональності\n"
+        markdown_content += (
+            "Тональність — це оцінка емоційного забарвлення тексту (негативна, нейтральна, позитивна). "
+            "Розподіл показує загальну емоційну атмосферу в ЗМІ. Також аналіз подає, як змінювалась тональність із часом.\n\n"
+        )
+        markdown_content += f"![Аналіз тональності]({figure_paths['all_tonality']})\n\n"
+        markdown_content += f"![Тональність за часом]({figure_paths['tonality_per_time']})\n\n"
 
     # Секція: NER
-    markdown_content += "## Аналіз згадувань (NER)\n"
-    markdown_content += (
-        "Цей розділ показує, які іменовані сутності (особи, організації, географічні назви) згадуються найчастіше. "
-        "Це дає змогу оцінити фокус ЗМІ на ключових фігурах і темах.\n\n"
-    )
-    markdown_content += f"![NER Аналіз]({figure_paths['ner_visualization']})\n\n"
+    if 'ner_visualization' in figure_paths:
+        markdown_content += "## Аналіз згадувань (NER)\n"
+        markdown_content += (
+            "Цей розділ показує, які іменовані сутності (особи, організації, географічні назви) згадуються найчастіше. "
+            "Це дає змогу оцінити фокус ЗМІ на ключових фігурах і темах.\n\n"
+        )
+        markdown_content += f"![NER Аналіз]({figure_paths['ner_visualization']})\n\n"
+
+    # Секція: Спільні згадування (є не в кожному режимі аналізу)
+    if 'entity_cooccurrence' in figure_paths:
+        markdown_content += "## Мережа спільних згадувань\n"
+        markdown_content += (
+            "Граф показує, які особи, організації та місця найчастіше згадуються в одних і тих самих новинах. "
+            "Таблиця нижче містить найсильніші пари, а також те, як вони змінювались по днях.\n\n"
+        )
+        markdown_content += f"![Спільні згадування]({figure_paths['entity_cooccurrence']})\n\n"
+        markdown_content += texts['entity_cooccurrence']
 
     # Секція: Repackaged news
-    markdown_content += "## Виявлення схожих новин\n"
-    markdown_content += (
-        "За допомогою векторизації та кластеризації виявлялись новини з дуже схожим текстом. "
-        "Це дозволяє знайти копії новин, розміщені на різних сайтах або варіації одних і тих же повідомлень.\n\n"
-    )
-    markdown_content += f"![Схожість новин]({figure_paths['repackaged_news']})\n\n"
-    markdown_content += texts['repackaged_news']
+    if 'repackaged_news' in texts:
+        markdown_content += "## Виявлення схожих новин\n"
+        markdown_content += (
+            "За допомогою векторизації та кластеризації виявлялись новини з дуже схожим текстом. "
+            "Це дозволяє знайти копії новин, розміщені на різних сайтах або варіації одних і тих же повідомлень.\n\n"
+        )
+        if 'repackaged_news' in figure_paths:
+            markdown_content += f"![Схожість новин]({figure_paths['repackaged_news']})\n\n"
+        markdown_content += texts['repackaged_news']
+
+    # Секція: Перефразовані новини (є не в кожному режимі аналізу)
+    if 'semantic_duplicates' in figure_paths:
+        markdown_content += "## Перефразовані новини\n"
+        markdown_content += (
+            "Крім дослівних копій, шукались новини з різних сайтів, що переказують ту саму історію іншими словами. "
+            "Подібність рахується між векторами документів, тому вона помічає переписані наративи.\n\n"
+        )
+        markdown_content += f"![Перефразовані новини]({figure_paths['semantic_duplicates']})\n\n"
+        markdown_content += texts['semantic_duplicates']
 
     # Секція: Заголовки vs текст
-    markdown_content += "## Узгодженість заголовків і текстів\n"
-    markdown_content += (
-        "Цей аналіз вимірює схожість між заголовками та основним текстом новини. "
-        "Низька схожість може свідчити про клікбейт або маніпуляцію. "
-        "Показано як загальну картину, так і приклади сумнівних новин.\n\n"
-    )
-    markdown_content += f"![Схожість заголовок ↔ текст]({figure_paths['title_text_similarity']})\n\n"
-    markdown_content += texts['title_text_similarity']
+    if 'title_text_similarity' in figure_paths:
+        markdown_content += "## Узгодженість заголовків і текстів\n"
+        markdown_content += (
+            "Цей аналіз вимірює схожість між заголовками та основним текстом новини. "
+            "Низька схожість може свідчити про клікбейт або маніпуляцію. "
+            "Показано як загальну картину, так і приклади сумнівних новин.\n\n"
+        )
+        markdown_content += f"![Схожість заголовок ↔ текст]({figure_paths['title_text_similarity']})\n\n"
+        markdown_content += texts['title_text_similarity']
 
     # Секція: Маніпуляція
-    markdown_content += "## Маніпулятивна лексика в новинах\n"
-    markdown_content += (
-        "Оцінено частоту використання слів, які можуть вказувати на маніпулятивну риторику "
-        "(емоційно забарвлені оцінки, тиск, узагальнення тощо). "
-        "Це дає змогу виявити публікації з потенційно навмисним впливом на читача.\n\n"
-    )
-    markdown_content += f"![Маніпулятивність]({figure_paths['manipulative_language']})\n\n"
-    markdown_content += texts['manipulative_language']
-
-    # Збереження
-    with open("news_analysis_report.md", "w", encoding="utf-8") as f:
-        f.write(markdown_content)
+    if 'manipulative_language' in figure_paths:
+        markdown_content += "## Маніпулятивна лексика в новинах\n"
+        markdown_content += (
+            "Оцінено частоту використання слів, які можуть вказувати на маніпулятивну риторику "
+            "(емоційно забарвлені оцінки, тиск, узагальнення тощо). "
+            "Це дає змогу виявити публікації з потенційно навмисним впливом на читача.\n\n"
+        )
+        markdown_content += f"![Маніпулятивність]({figure_paths['manipulative_language']})\n\n"
+        markdown_content += texts['manipulative_language']
 
-    # Збереження звіту
-    with open("news_analysis_report.md", "w", encoding="utf-8") as f:
-        f.write(markdown_content)
+    return markdown_content
@@ -0,0 +1,533 @@
+"""
+Інвертований індекс по лемах (processed_text) та іменованих сутностях для швидкого пошуку новин.
+Індекс зберігається на диску сегментами: кожна нова порція статей пишеться окремим сегментом,
+тому оновлення інкрементальне і не переписує вже збережені дані. Щоб дрібні сегменти (наприклад,
+по одній статті з сервісу) не накопичувались, add_articles зливає merge_factor останніх сегментів
+однакового порядку розміру в один, тож сегментів лишається O(merge_factor · log N).
+
+Списки входжень кожного терміну стиснуті: номери статей і позиції лем зберігаються як різниці,
+закодовані varint, окремими блоками (номери статей, кількості позицій, позиції). Для AND / OR / NOT
+читається лише блок номерів статей, позиції декодуються тільки для фраз; декодування векторизоване.
+
+Підтримується запит з AND / OR / NOT, дужками, фразами в лапках та сутностями з префіксом ent:
+    зеленський AND "мирний план"
+    (обстріл OR атака) NOT ent:"харків"
+Терміни запиту — це леми в нижньому регістрі, так само як у processed_text. Фрази шукаються
+по послідовності лем після видалення стоп-слів.
+
+Приклади:
+    python search_index.py add --csv parsed_articles.csv
+    python search_index.py query 'зеленський AND "мирний план"' --from 2024-11-10 --to 2024-11-12
+    python search_index.py compact
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+
+ENTITY_PREFIX = 'ent:'
+MANIFEST_NAME = 'manifest.json'
+INDEX_FORMAT = 2
+# Менші файли входжень читаються в пам'ять, а не через mmap, щоб не тримати дескриптор на кожен сегмент
+MMAP_MIN_BYTES = 4 << 20
+
+
+# ------------------------- Стиснення списків входжень -------------------------
+def _encode_varints(values):
+    """Масив невід'ємних цілих -> байти varint (7 біт на байт, старший біт — «далі ще байт»)."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        n_bytes += rest > 0
+        rest >>= np.uint64(7)
+
+    value_index = np.repeat(np.arange(len(values)), n_bytes)
+    byte_index = np.arange(len(value_index)) - np.repeat(np.cumsum(n_bytes) - n_bytes, n_bytes)
+    out = (values[value_index] >> (7 * byte_index).astype(np.uint64)) & np.uint64(0x7F)
+    out |= np.where(byte_index < n_bytes[value_index] - 1, 0x80, 0).astype(np.uint64)
+    return out.astype(np.uint8).tobytes()
+
+
+def _decode_varints(buf):
+    """Масив байтів (np.uint8) -> масив значень int64."""
+    last = buf < 0x80
+    if last.all():
+        # Найчастіший випадок — усі різниці менші за 128 і займають по одному байту
+        return buf.astype(np.int64)
+    ends = np.flatnonzero(last)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = 7 * (np.arange(len(buf)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((buf & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def _read_header(buf):
+    # Три varint-и на початку списку: кількість статей і довжини блоків номерів і кількостей позицій
+    header, value, shift, i = [], 0, 0, 0
+    while len(header) < 3:
+        byte = int(buf[i])
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        i += 1
+        if not byte & 0x80:
+            header.append(value)
+            value = shift = 0
+    return header, i
+
+
+def encode_postings(doc_ids, counts, positions):
+    """
+    doc_ids — відсортовані номери статей, counts — кількість позицій у кожній,
+    positions — позиції всіх статей підряд (у межах статті за зростанням).
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+
+    doc_gaps = np.diff(doc_ids, prepend=0)
+    position_gaps = np.diff(positions, prepend=0)
+    first = np.cumsum(counts) - counts
+    position_gaps[first] = positions[first]  # перша позиція кожної статті — абсолютна
+
+    doc_block, count_block = _encode_varints(doc_gaps), _encode_varints(counts)
+    header = _encode_varints([len(doc_ids), len(doc_block), len(count_block)])
+    return header + doc_block + count_block + _encode_varints(position_gaps)
+
+
+def decode_doc_ids(buf):
+    """Лише номери статей зі списку входжень (буфер np.uint8), без позицій."""
+    (_, doc_bytes, _), start = _read_header(buf)
+    return np.cumsum(_decode_varints(buf[start:start + doc_bytes]))
+
+
+def decode_postings(buf):
+    """Повний список входжень: (doc_ids, counts, positions) як у encode_postings."""
+    (_, doc_bytes, count_bytes), start = _read_header(buf)
+    doc_ids = np.cumsum(_decode_varints(buf[start:start + doc_bytes]))
+    counts = _decode_varints(buf[start + doc_bytes:start + doc_bytes + count_bytes])
+
+    position_gaps = _decode_varints(buf[start + doc_bytes + count_bytes:])
+    running = np.cumsum(position_gaps)
+    first = np.cumsum(counts) - counts
+    positions = running - np.repeat(running[first] - position_gaps[first], counts)
+    return doc_ids, counts, positions
+
+
+def _intersect_sorted(a, b):
+    """Перетин двох відсортованих масивів без повторів: бінарний пошук меншого у більшому."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    found = np.searchsorted(b, a)
+    return a[b[np.minimum(found, len(b) - 1)] == a]
+
+
+def _concat_postings(parts):
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+# ------------------------- Розбір запиту -------------------------
+_QUERY_TOKEN_RE = re.compile(r'\(|\)|ent:"[^"]*"|"[^"]*"|[^\s()]+')
+
+
+def parse_query(query):
+    """Перетворює рядок запиту на дерево: ('term', t), ('phrase', [t, ...]), ('and'|'or', a, b), ('not', a)."""
+    tokens = _QUERY_TOKEN_RE.findall(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == 'OR':
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() is not None and peek() not in ('OR', ')'):
+            if peek() == 'AND':
+                take()
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == 'NOT':
+            take()
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = take() if peek() is not None else None
+        if token is None:
+            raise ValueError(f"Неочікуваний кінець запиту: {query!r}")
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError(f"Не закрита дужка в запиті: {query!r}")
+            take()
+            return node
+        if token.startswith(ENTITY_PREFIX):
+            return ('term', ENTITY_PREFIX + token[len(ENTITY_PREFIX):].strip('"').lower())
+        if token.startswith('"'):
+            words = token.strip('"').lower().split()
+            if not words:
+                raise ValueError("Порожня фраза в запиті")
+            return ('phrase', words) if len(words) > 1 else ('term', words[0])
+        return ('term', token.lower())
+
+    if not tokens:
+        raise ValueError("Порожній запит")
+    tree = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Зайві символи в запиті: {' '.join(tokens[pos:])}")
+    return tree
+
+
+# ------------------------- Індекс -------------------------
+class InvertedIndex:
+    def __init__(self, index_dir, merge_factor=10):
+        self.index_dir = index_dir
+        self.merge_factor = merge_factor
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        manifest_path = os.path.join(self.index_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'next_doc_id': 0, 'segments': [], 'format': INDEX_FORMAT}
+        if self.manifest.get('format', 1) != INDEX_FORMAT and self.manifest['segments']:
+            raise ValueError(f"Індекс у {self.index_dir} має старий формат списків входжень; "
+                             f"видаліть каталог і проіндексуйте статті заново (python search_index.py add)")
+        self.manifest['format'] = INDEX_FORMAT
+        if 'next_segment' not in self.manifest:
+            # Старі маніфести без лічильника: наступний номер після найбільшого наявного
+            numbers = [int(name.split('_')[1]) for name in self.manifest['segments']]
+            self.manifest['next_segment'] = max(numbers, default=0) + 1
+
+        self.segments = []
+        self.titles, self.urls, dates = [], [], []
+        for name in self.manifest['segments']:
+            segment, docs = self._open_segment(name, len(self.titles))
+            self.segments.append(segment)
+            self.titles.extend(docs['titles'])
+            self.urls.extend(docs['urls'])
+            dates.extend(docs['dates'])
+        self.dates = np.array(dates, dtype='datetime64[m]')
+        self.known_urls = set(self.urls)
+
+    def _path(self, name, suffix):
+        return os.path.join(self.index_dir, f'{name}.{suffix}')
+
+    def _open_segment(self, name, first_doc):
+        """Сегмент і його документи; номери документів сегмента починаються з first_doc."""
+        with open(self._path(name, 'lex.json'), 'r', encoding='utf-8') as f:
+            lexicon = json.load(f)
+        with open(self._path(name, 'docs.json'), 'r', encoding='utf-8') as f:
+            docs = json.load(f)
+
+        # mmap тримає власну копію дескриптора, тому сам файл одразу закривається
+        with open(self._path(name, 'post'), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            postings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_MIN_BYTES else f.read()
+
+        segment = {'name': name, 'lexicon': lexicon, 'postings': postings,
+                   'first_doc': first_doc, 'n_docs': len(docs['urls'])}
+        return segment, docs
+
+    def _close_segments(self, segments):
+        for segment in segments:
+            if isinstance(segment['postings'], mmap.mmap):
+                segment['postings'].close()
+
+    def close(self):
+        self._close_segments(self.segments)
+        self.segments = []
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _write_manifest(self):
+        # Маніфест — точка фіксації: сегмент вважається доданим лише після його атомарного запису
+        tmp_path = os.path.join(self.index_dir, MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, MANIFEST_NAME))
+
+    def _new_segment_name(self, suffix):
+        # Номер сегмента ніколи не повторюється, тож новий сегмент не перезапише наявний
+        name = f"seg_{self.manifest['next_segment']:06d}_{suffix}"
+        self.manifest['next_segment'] += 1
+        return name
+
+    def _write_segment(self, name, term_postings, docs):
+        lexicon = {}
+        with open(self._path(name, 'post'), 'wb') as f:
+            offset = 0
+            for term in sorted(term_postings):
+                blob = encode_postings(*term_postings[term])
+                f.write(blob)
+                lexicon[term] = [offset, len(blob)]
+                offset += len(blob)
+        with open(self._path(name, 'lex.json'), 'w', encoding='utf-8') as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+        with open(self._path(name, 'docs.json'), 'w', encoding='utf-8') as f:
+            json.dump(docs, f, ensure_ascii=False)
+
+    def add_articles(self, df):
+        """
+        Додає статті новим сегментом. Потрібні колонки title, url, date, processed_text;
+        колонка entities необов'язкова. Вже проіндексовані URL пропускаються; статті без URL
+        не дедуплікуються, бо їх нема з чим порівняти.
+        """
+        seen = df['url'].isin(self.known_urls) | df['url'].duplicated()
+        df = df[~(df['url'].notna() & seen)]
+        if df.empty:
+            return 0
+
+        term_postings = defaultdict(lambda: ([], [], []))
+        docs = {'titles': [], 'urls': [], 'dates': []}
+        doc_id = self.manifest['next_doc_id']
+        entities_column = df['entities'] if 'entities' in df.columns else [[]] * len(df)
+
+        for title, url, date, tokens, entities in zip(df['title'], df['url'], df['date'],
+                                                      df['processed_text'], entities_column):
+            positions = defaultdict(list)
+            for pos, token in enumerate(tokens):
+                positions[token].append(pos)
+            for pos, entity in enumerate(entities):
+                positions[ENTITY_PREFIX + entity.lower()].append(pos)
+            for term, term_positions in positions.items():
+                doc_ids, counts, all_positions = term_postings[term]
+                doc_ids.append(doc_id)
+                counts.append(len(term_positions))
+                all_positions.extend(term_positions)
+
+            docs['titles'].append(title)
+            docs['urls'].append(url)
+            docs['dates'].append(str(np.datetime64(date, 'm')))
+            doc_id += 1
+
+        name = self._new_segment_name(self.manifest['next_doc_id'])
+        self._write_segment(name, term_postings, docs)
+        self.manifest['segments'].append(name)
+        first_doc, self.manifest['next_doc_id'] = self.manifest['next_doc_id'], doc_id
+        self._write_manifest()
+
+        # Підхоплюємо новий сегмент без перечитування всього індексу
+        segment, _ = self._open_segment(name, first_doc)
+        self.segments.append(segment)
+        self.titles.extend(docs['titles'])
+        self.urls.extend(docs['urls'])
+        self.dates = np.concatenate([self.dates, np.array(docs['dates'], dtype='datetime64[m]')])
+        self.known_urls.update(docs['urls'])
+
+        self._maybe_merge()
+        return len(docs['urls'])
+
+    def _level(self, n_docs):
+        # Порядок розміру сегмента за основою merge_factor: 1-9 статей — 0, 10-99 — 1, ...
+        return int(np.log(max(n_docs, 1)) / np.log(self.merge_factor) + 1e-9)
+
+    def _maybe_merge(self):
+        """Зливає хвіст із merge_factor сегментів одного порядку розміру; злиття можуть іти каскадом."""
+        while len(self.segments) >= self.merge_factor:
+            tail_level = self._level(self.segments[-1]['n_docs'])
+            run = 1
+            while run < len(self.segments) and self._level(self.segments[-run - 1]['n_docs']) == tail_level:
+                run += 1
+            if run < self.merge_factor:
+                return
+            self._merge_segments(len(self.segments) - run)
+
+    def _term_buffers(self, segments, term):
+        # Байти списку входжень у кожному сегменті без копіювання з mmap
+        for segment in segments:
+            entry = segment['lexicon'].get(term)
+            if entry is not None:
+                offset, length = entry
+                yield np.frombuffer(segment['postings'], dtype=np.uint8, count=length, offset=offset)
+
+    def _segment_postings(self, segments, term):
+        return _concat_postings([decode_postings(buf) for buf in self._term_buffers(segments, term)])
+
+    def postings(self, term):
+        """(doc_ids, counts, positions) терміну в усіх сегментах."""
+        return self._segment_postings(self.segments, term)
+
+    def doc_ids(self, term):
+        """Відсортовані номери статей з терміном; позиції не декодуються."""
+        parts = [decode_doc_ids(buf) for buf in self._term_buffers(self.segments, term)]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _merge_segments(self, start):
+        """Зливає сегменти self.segments[start:] в один; номери документів при цьому не змінюються."""
+        merged = self.segments[start:]
+        if len(merged) <= 1:
+            return
+
+        terms = set()
+        for segment in merged:
+            terms.update(segment['lexicon'])
+        term_postings = {term: self._segment_postings(merged, term) for term in terms}
+        first_doc = merged[0]['first_doc']
+        end_doc = merged[-1]['first_doc'] + merged[-1]['n_docs']
+        docs = {'titles': self.titles[first_doc:end_doc], 'urls': self.urls[first_doc:end_doc],
+                'dates': [str(d) for d in self.dates[first_doc:end_doc]]}
+
+        name = self._new_segment_name('merged' if start else 'compact')
+        self._write_segment(name, term_postings, docs)
+        self.manifest['segments'] = self.manifest['segments'][:start] + [name]
+        self._write_manifest()
+
+        self._close_segments(merged)
+        for segment in merged:
+            for suffix in ('post', 'lex.json', 'docs.json'):
+                os.remove(self._path(segment['name'], suffix))
+        self.segments[start:] = [self._open_segment(name, first_doc)[0]]
+
+    def compact(self):
+        """Зливає всі сегменти в один, щоб запит не обходив багато дрібних файлів."""
+        self._merge_segments(0)
+
+    # ------------------------- Пошук -------------------------
+    def _evaluate(self, node):
+        """Відсортований масив номерів статей, що відповідають вузлу запиту."""
+        kind = node[0]
+        if kind == 'term':
+            return self.doc_ids(node[1])
+        if kind == 'phrase':
+            return self._phrase_docs(node[1])
+        if kind == 'and':
+            return _intersect_sorted(self._evaluate(node[1]), self._evaluate(node[2]))
+        if kind == 'or':
+            return np.union1d(self._evaluate(node[1]), self._evaluate(node[2]))
+        if kind == 'not':
+            return np.setdiff1d(np.arange(len(self)), self._evaluate(node[1]), assume_unique=True)
+        raise ValueError(f"Невідомий вузол запиту {kind}")
+
+    def _phrase_docs(self, words):
+        # Ключ (стаття, позиція початку фрази): для слова з відступом offset це (doc, pos - offset).
+        # Фраза є там, де ключі всіх слів збігаються. Ключі вже відсортовані, бо позиції йдуть за зростанням
+        candidates = self.doc_ids(words[0])
+        for word in words[1:]:
+            candidates = _intersect_sorted(candidates, self.doc_ids(word))
+        if not len(candidates):
+            return candidates
+
+        keys = None
+        for offset, word in enumerate(words):
+            doc_ids, counts, positions = self.postings(word)
+            docs = np.repeat(doc_ids, counts)
+            starts = positions - offset
+            valid = starts >= 0
+            word_keys = (docs[valid] << 32) | starts[valid]
+            keys = word_keys if keys is None else _intersect_sorted(keys, word_keys)
+            if not len(keys):
+                break
+        return np.unique(keys >> 32)
+
+    def search(self, query, date_from=None, date_to=None, limit=20):
+        """Повертає (кількість збігів, найсвіжіші limit статей)."""
+        doc_ids = self._evaluate(parse_query(query))
+        if date_from is not None:
+            doc_ids = doc_ids[self.dates[doc_ids] >= np.datetime64(date_from, 'm')]
+        if date_to is not None:
+            upper = np.datetime64(date_to, 'm')
+            if len(str(date_to)) <= 10:
+                # Дата без часу включає весь день
+                doc_ids = doc_ids[self.dates[doc_ids] < upper + np.timedelta64(1, 'D')]
+            else:
+                doc_ids = doc_ids[self.dates[doc_ids] <= upper]
+
+        order = np.argsort(self.dates[doc_ids])[::-1][:limit]
+        results = [
+            {'id': int(doc_id), 'date': str(self.dates[doc_id]), 'title': self.titles[doc_id], 'url': self.urls[doc_id]}
+            for doc_id in doc_ids[order]
+        ]
+        return len(doc_ids), results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Інвертований індекс новин")
+    arg_parser.add_argument('--index-dir', default='search_index')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="Проіндексувати статті з CSV (вже проіндексовані пропускаються)")
+    add_parser.add_argument('--csv', default='parsed_articles.csv')
+    add_parser.add_argument('--stop-words', default='data/ukrainian_stopwords.txt')
+    add_parser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'], default='spacy')
+    add_parser.add_argument('--batch-size', type=int, default=1000)
+    add_parser.add_argument('--no-entities', action='store_true', help="Не запускати NER")
+
+    query_parser = subparsers.add_parser('query', help="Пошук статей")
+    query_parser.add_argument('query')
+    query_parser.add_argument('--from', dest='date_from')
+    query_parser.add_argument('--to', dest='date_to')
+    query_parser.add_argument('--limit', type=int, default=20)
+
+    subparsers.add_parser('compact', help="Злити всі сегменти в один")
+    subparsers.add_parser('stats', help="Розмір індексу")
+
+    args = arg_parser.parse_args()
+    index = InvertedIndex(args.index_dir)
+
+    if args.command == 'add':
+        from tools import make_preprocessor, load_ner_model, extract_entities, iter_article_batches, clean_text_column
+
+        preprocess = make_preprocessor(args.lemmatizer, args.stop_words)
+        nlp_ner = None if args.no_entities else load_ner_model()
+
+        for batch in iter_article_batches(args.csv, batch_rows=args.batch_size):
+            batch = batch.dropna(subset=['title', 'url', 'date', 'text'])
+            batch = batch[~batch['url'].isin(index.known_urls)].copy()
+            batch['processed_text'] = clean_text_column(batch['text']).apply(lambda x: preprocess(x, cleaned=True))
+            if nlp_ner is not None:
+                batch['entities'] = batch['processed_text'].apply(
+                    lambda tokens: extract_entities(" ".join(tokens), nlp_ner)
+                )
+            print(f'Додано {index.add_articles(batch)} статей, всього {len(index)}')
+
+    elif args.command == 'query':
+        import time
+
+        start = time.perf_counter()
+        total, results = index.search(args.query, args.date_from, args.date_to, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f'Знайдено {total} статей за {elapsed_ms:.1f} мс')
+        for result in results:
+            print(f"{result['date']}  {result['title']}\n    {result['url']}")
+
+    elif args.command == 'compact':
+        index.compact()
+        print(f'Індекс злито в один сегмент, {len(index)} статей')
+
+    elif args.command == 'stats':
+        size = sum(os.path.getsize(os.path.join(args.index_dir, f)) for f in os.listdir(args.index_dir))
+        print(f"Статей: {len(index)}, сегментів: {len(index.segments)}, розмір: {size / 1024 / 1024:.1f} МБ")
+
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Пошук семантично схожих (перефразованих) новин з різних сайтів.
+detect_repackaged_news ловить лише лексичні копії через TF-IDF, тому тут кожна новина
+представляється вектором документа — середнім статичних векторів uk_core_news_lg по її лемах.
+Вектори float32 зберігаються у файлі на диску і читаються через np.memmap, тож між запусками
+векторизуються тільки нові статті. Кандидати в пари шукаються наближено: випадкові проєкції
+(LSH з кількома таблицями) розбивають центровані вектори на кошики, а точна косинусна
+подібність рахується лише всередині кошиків.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from tools import site_from_url
+
+VECTORS_NAME = 'vectors.f32'
+META_NAME = 'meta.json'
+LSH_NAME = 'lsh.npz'
+
+
+def document_vectors(token_lists, vocab):
+    """Середній вектор лем кожного документа (нульовий, якщо жодна лема не має вектора)."""
+    dim = vocab.vectors.shape[1]
+    vectors = np.zeros((len(token_lists), dim), dtype=np.float32)
+    lemma_vectors = {}
+
+    for i, tokens in enumerate(token_lists):
+        found = []
+        for token in tokens:
+            if token not in lemma_vectors:
+                lemma_vectors[token] = vocab.get_vector(token) if vocab.has_vector(token) else None
+            if lemma_vectors[token] is not None:
+                found.append(lemma_vectors[token])
+        if found:
+            vectors[i] = np.mean(found, axis=0)
+
+    return vectors
+
+
+class DocumentVectorStore:
+    """Матриця векторів документів у файлі на диску з метаданими (url, заголовок, сайт)."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+        meta_path = os.path.join(store_dir, META_NAME)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'dim': None, 'urls': [], 'titles': [], 'sites': []}
+        self.url_to_row = {url: row for row, url in enumerate(self.meta['urls'])}
+
+    def __len__(self):
+        return len(self.meta['urls'])
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.store_dir, VECTORS_NAME)
+
+    def vectors(self):
+        if not len(self):
+            return np.zeros((0, self.meta['dim'] or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self), self.meta['dim']))
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.store_dir, name)) for name in os.listdir(self.store_dir))
+
+    def add(self, urls, titles, vectors):
+        if self.meta['dim'] is None:
+            self.meta['dim'] = int(vectors.shape[1])
+
+        # Дописуємо вектори в кінець файлу, метадані оновлюються після запису. Рядки, дописані
+        # перед збоєм, але не зафіксовані в meta.json, спершу відрізаємо, щоб не зсунути нові
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(len(self) * self.meta['dim'] * np.dtype(np.float32).itemsize)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+        for url, title in zip(urls, titles):
+            self.url_to_row[url] = len(self.meta['urls'])
+            self.meta['urls'].append(url)
+            self.meta['titles'].append(title)
+            self.meta['sites'].append(site_from_url(url))
+
+        tmp_path = os.path.join(self.store_dir, META_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.store_dir, META_NAME))
+
+
+class RandomProjectionIndex:
+    """
+    LSH на випадкових гіперплощинах. Код документа в кожній таблиці — знаки проєкцій центрованого
+    вектора на n_bits гіперплощин. Коди зберігаються поруч зі сховищем і дораховуються лише для нових рядків.
+    """
+
+    def __init__(self, store, n_tables=12, n_bits=10, seed=42, block_rows=20000):
+        self.store = store
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+        self.block_rows = block_rows
+        self.path = os.path.join(store.store_dir, LSH_NAME)
+        self.mean = None
+        self.planes = None
+        self.codes = np.zeros((0, n_tables), dtype=np.uint32)
+
+        if os.path.exists(self.path):
+            saved = np.load(self.path)
+            if saved['planes'].shape[:2] == (n_tables, n_bits):
+                self.mean, self.planes, self.codes = saved['mean'], saved['planes'], saved['codes']
+
+    def _compute_codes(self, vectors):
+        weights = (1 << np.arange(self.n_bits)).astype(np.uint32)
+        codes = []
+        for start in range(0, len(vectors), self.block_rows):
+            block = np.asarray(vectors[start:start + self.block_rows]) - self.mean
+            bits = np.einsum('nd,tbd->ntb', block, self.planes) > 0
+            codes.append((bits * weights).sum(axis=2).astype(np.uint32))
+        return np.concatenate(codes) if codes else np.zeros((0, self.n_tables), dtype=np.uint32)
+
+    def _mean(self, vectors):
+        # Поблочно, щоб не читати всю memmap-матрицю в пам'ять. Нульові вектори (статті без жодної
+        # леми зі словника векторів) не несуть змісту і не зсувають центр
+        total = np.zeros(vectors.shape[1], dtype=np.float64)
+        count = 0
+        for start in range(0, len(vectors), self.block_rows):
+            block = np.asarray(vectors[start:start + self.block_rows])
+            total += block.sum(axis=0, dtype=np.float64)
+            count += int(np.count_nonzero(block.any(axis=1)))
+        return (total / max(count, 1)).astype(np.float32)
+
+    def _nonzero_rows(self, vectors, rows):
+        # Після центрування всі нульові вектори дорівнюють -mean і збігалися б між собою з подібністю 1
+        keep = [np.asarray(vectors[rows[start:start + self.block_rows]]).any(axis=1)
+                for start in range(0, len(rows), self.block_rows)]
+        return rows[np.concatenate(keep)] if keep else rows
+
+    def update(self):
+        """Дораховує коди для нових векторів; повністю перебудовує індекс, якщо корпус виріс удвічі."""
+        vectors = self.store.vectors()
+        if self.planes is None or len(vectors) >= 2 * max(len(self.codes), 1):
+            self.mean = self._mean(vectors)
+            rng = np.random.default_rng(self.seed)
+            self.planes = rng.standard_normal((self.n_tables, self.n_bits, vectors.shape[1])).astype(np.float32)
+            self.codes = self._compute_codes(vectors)
+        elif len(vectors) > len(self.codes):
+            self.codes = np.concatenate([self.codes, self._compute_codes(vectors[len(self.codes):])])
+
+        np.savez(self.path, mean=self.mean, planes=self.planes, codes=self.codes)
+
+    def _normalized(self, vectors, rows):
+        block = np.asarray(vectors[rows]) - self.mean
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        return block / np.maximum(norms, 1e-12)
+
+    def similar_pairs(self, threshold=0.9, rows=None, cross_site=True, max_bucket=2000):
+        """
+        Пари (row_1, row_2, similarity) з косинусною подібністю центрованих векторів >= threshold.
+        rows обмежує пошук підмножиною рядків сховища (наприклад, статтями поточного запуску).
+        Статті з нульовим вектором документа в пари не потрапляють.
+        """
+        vectors = self.store.vectors()
+        sites = np.asarray(self.store.meta['sites'])
+        rows = np.arange(len(vectors)) if rows is None else np.asarray(rows, dtype=np.int64)
+        rows = self._nonzero_rows(vectors, rows)
+
+        found = {}
+        for table in range(self.n_tables):
+            table_codes = self.codes[rows, table]
+            order = np.argsort(table_codes, kind='stable')
+            boundaries = np.flatnonzero(np.diff(table_codes[order])) + 1
+            for bucket in np.split(rows[order], boundaries):
+                # Дуже великі кошики відповідають «середнім» новинам, а не парафразам
+                if len(bucket) < 2 or len(bucket) > max_bucket:
+                    continue
+                normalized = self._normalized(vectors, bucket)
+                sims = normalized @ normalized.T
+                i_idx, j_idx = np.nonzero(np.triu(sims >= threshold, k=1))
+                for i, j in zip(i_idx, j_idx):
+                    row_1, row_2 = bucket[i], bucket[j]
+                    if cross_site and sites[row_1] == sites[row_2]:
+                        continue
+                    found[(min(row_1, row_2), max(row_1, row_2))] = float(sims[i, j])
+
+        return [(row_1, row_2, sim) for (row_1, row_2), sim in found.items()]
+
+
+def detect_semantic_duplicates(news_df, vocab, store_dir='vector_store', threshold=0.9, top_k=10):
+    """
+    Потребує колонок url, title, processed_text. vocab — словник spaCy з векторами
+    (наприклад, nlp_ner.vocab для uk_core_news_lg).
+    """
+    store = DocumentVectorStore(store_dir)
+
+    # Векторизуємо лише статті, яких ще немає у сховищі з попередніх запусків
+    new_articles = news_df[~news_df['url'].isin(store.url_to_row)].drop_duplicates(subset='url')
+    start = time.perf_counter()
+    if len(new_articles):
+        store.add(new_articles['url'].tolist(), new_articles['title'].tolist(),
+                  document_vectors(new_articles['processed_text'].tolist(), vocab))
+    vectorize_seconds = time.perf_counter() - start
+
+    index = RandomProjectionIndex(store)
+    start = time.perf_counter()
+    index.update()
+    rows = [store.url_to_row[url] for url in news_df['url'].drop_duplicates()]
+    pairs = index.similar_pairs(threshold=threshold, rows=rows)
+    query_seconds = time.perf_counter() - start
+
+    similar_df = pd.DataFrame(pairs, columns=['row_1', 'row_2', 'similarity'])
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.hist(similar_df['similarity'], bins=20, range=(threshold, 1), color='mediumpurple', edgecolor='black')
+    ax.set_title("Семантична подібність перефразованих новин з різних сайтів")
+    ax.set_xlabel("Косинусна подібність векторів документів")
+    ax.set_ylabel("Кількість пар")
+    ax.grid(True)
+    fig.tight_layout()
+
+    titles, sites = store.meta['titles'], store.meta['sites']
+    markdown_text = "## Семантично схожі новини (перефразовані)\n"
+    markdown_text += (
+        f"Знайдено {len(similar_df)} пар новин з різних сайтів із подібністю векторів понад {threshold}.\n\n"
+        f"Сховище векторів: {len(store)} документів, {store.size_bytes() / 1024 / 1024:.1f} МБ на диску. "
+        f"Нових векторів: {len(new_articles)} за {vectorize_seconds:.1f} с. "
+        f"Пошук: {len(rows)} документів за {query_seconds:.2f} с "
+        f"({len(rows) / max(query_seconds, 1e-9):.0f} документів/с).\n\n"
+        "Найбільш схожі пари:\n\n"
+    )
+    for row_1, row_2, similarity in similar_df.nlargest(top_k, 'similarity').itertuples(index=False):
+        markdown_text += (
+            f"- **{titles[row_1]}** ({sites[row_1]})\n"
+            f"  ↔ **{titles[row_2]}** ({sites[row_2]}) — подібність: {similarity:.3f}\n"
+        )
+
+    return fig, markdown_text
@@ -0,0 +1,248 @@
+"""
+Сервіс інкрементального аналізу новин.
+Замість повного перерахунку в main() тримаємо в пам'яті агрегований стан (aggregates.py) і оновлюємо
+його кожною новою порцією статей: з парсера (--crawl), з готового CSV (--csv) або через POST /articles.
+Поточні результати віддаються локальним HTTP/JSON API. Відповіді на GET формуються з уже
+підготовленого знімка стану, тому не чекають на обробку нових статей.
+
+Приклади:
+    python service.py --csv parsed_articles.csv --port 8050
+    curl localhost:8050/stats
+    curl "localhost:8050/entities?top=20"
+    curl -X POST localhost:8050/report
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import matplotlib
+matplotlib.use('Agg')  # Графіки будуються в потоці сервера, без вікон
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from aggregates import AnalysisAggregates, enrich_batch, SENTIMENT_BINS, MANIPULATION_BINS
+from report_generator import generate_markdown_report
+from search_index import InvertedIndex
+from tools import (
+    iter_article_batches, make_preprocessor, load_ner_model, load_sentiment_analyzer,
+    load_manipulative_phrases, PhraseAutomaton
+)
+
+# Скільки елементів тримаємо в знімку для ендпоінтів з параметром top
+MAX_TOP = 500
+# Без цих полів стаття не може бути проаналізована (url необов'язковий, якщо немає індексу пошуку)
+REQUIRED_FIELDS = ('title', 'date', 'text')
+ARTICLE_FIELDS = ('title', 'date', 'text', 'url')
+
+
+def articles_from_payload(articles, require_url=False):
+    """Перевіряє тіло POST /articles і повертає датафрейм статей; ValueError, якщо щось не так."""
+    if isinstance(articles, dict):
+        articles = [articles]
+    if not isinstance(articles, list) or not all(isinstance(a, dict) for a in articles):
+        raise ValueError("Очікується стаття або список статей (JSON-об'єкти)")
+
+    required = REQUIRED_FIELDS + (('url',) if require_url else ())
+    incomplete = [i for i, article in enumerate(articles) if any(article.get(field) is None for field in required)]
+    if incomplete:
+        raise ValueError(f"Статті {incomplete[:10]} не мають полів {', '.join(required)}")
+    not_strings = [i for i, article in enumerate(articles)
+                   if any(not isinstance(article.get(field), str) for field in ARTICLE_FIELDS
+                          if article.get(field) is not None)]
+    if not_strings:
+        raise ValueError(f"У статтях {not_strings[:10]} поля {', '.join(ARTICLE_FIELDS)} мають бути рядками")
+
+    return pd.DataFrame(articles, columns=list(ARTICLE_FIELDS))
+
+
+class NewsAnalysisService:
+    def __init__(self, preprocess, nlp_ner_model, SIA_model, manipulative_automaton, duplicate_threshold=0.9,
+                 search_index=None):
+        self.preprocess = preprocess
+        self.nlp_ner_model = nlp_ner_model
+        self.SIA_model = SIA_model
+        self.manipulative_automaton = manipulative_automaton
+        self.search_index = search_index  # InvertedIndex з search_index.py, оновлюється разом зі станом
+
+        self.aggregates = AnalysisAggregates(duplicate_threshold=duplicate_threshold,
+                                             manipulative_dictionary_size=len(manipulative_automaton))
+        self._ingest_lock = threading.Lock()  # spaCy-моделі обробляють одну порцію за раз
+        self._state_lock = threading.Lock()
+        self._snapshot = self._build_snapshot()
+
+    def ingest(self, articles_df):
+        """
+        Обробляє порцію статей (колонки title, date, text, url) і оновлює стан.
+        enrich_batch не змінює стан, тож помилка в даних порції нічого не зачіпає;
+        індекс оновлюється лише після успішного оновлення агрегатів.
+        """
+        with self._ingest_lock:
+            batch = enrich_batch(articles_df, self.preprocess, self.nlp_ner_model,
+                                 self.SIA_model, self.manipulative_automaton)
+            with self._state_lock:
+                self.aggregates.update(batch)
+                self._snapshot = self._build_snapshot()
+            if self.search_index is not None:
+                self.search_index.add_articles(batch)
+
+        print(f'Оброблено {len(batch)} нових статей, всього {self.aggregates.n_articles}')
+        return len(batch)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def write_report(self):
+        """Генерує news_analysis_report.md з поточного стану в пам'яті."""
+        with self._state_lock:
+            if self.aggregates.n_articles == 0:
+                raise ValueError("Ще немає жодної обробленої статті")
+            figures = self.aggregates.figures()
+            texts = self.aggregates.texts()
+            summary = self.aggregates.summary()
+
+        report_path = generate_markdown_report(None, figures, texts, summary=summary)
+        for fig in figures.values():
+            plt.close(fig)
+
+        return report_path
+
+    def _build_snapshot(self):
+        aggregates = self.aggregates
+        duplicates = aggregates.duplicates  # None, якщо пошук копіпасту вимкнено
+        return {
+            'stats': {
+                'n_articles': aggregates.n_articles,
+                'date_min': None if aggregates.date_min is None else str(aggregates.date_min),
+                'date_max': None if aggregates.date_max is None else str(aggregates.date_max),
+                'mean_sentiment': aggregates.mean_sentiment(),
+                'repackaged_pairs': None if duplicates is None else duplicates.n_pairs,
+            },
+            'hourly': {str(hour): int(count) for hour, count in enumerate(aggregates.hourly_counts)},
+            'sentiment': {
+                'bin_edges': SENTIMENT_BINS.tolist(),
+                'counts': aggregates.sentiment_hist.tolist(),
+                'daily_mean': {str(day): value for day, value in aggregates.daily_sentiment_means().items()},
+            },
+            'words': aggregates.word_counts.most_common(MAX_TOP),
+            'entities': aggregates.entity_counts.most_common(MAX_TOP),
+            'manipulation': {
+                'bin_edges': MANIPULATION_BINS.tolist(),
+                'counts': aggregates.manipulation_hist.tolist(),
+                'top': [{'title': title, 'count': count, 'ratio': ratio}
+                        for ratio, count, title in aggregates.most_manipulative()],
+                'top_phrases': aggregates.phrase_counts.most_common(MAX_TOP),
+            },
+            'title_similarity': [{'title': title, 'similarity': similarity}
+                                 for title, similarity in aggregates.least_similar()],
+            'duplicates': None if duplicates is None else {
+                'threshold': duplicates.threshold,
+                'n_pairs': duplicates.n_pairs,
+                'top': [{'title_1': title_1, 'title_2': title_2, 'similarity': similarity}
+                        for similarity, title_1, title_2 in duplicates.most_similar(duplicates.max_pairs)],
+            },
+        }
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            name = url.path.strip('/').replace('-', '_') or 'stats'
+            snapshot = service.snapshot()
+            if name not in snapshot:
+                self._send_json({'error': f'Невідомий ендпоінт {url.path}'}, status=404)
+                return
+
+            payload = snapshot[name]
+            if name in ('words', 'entities'):
+                top = parse_qs(url.query).get('top', ['50'])[0]
+                if not top.isdigit():
+                    self._send_json({'error': f"Параметр top має бути невід'ємним цілим числом, отримано {top!r}"},
+                                    status=400)
+                    return
+                payload = payload[:int(top)]
+            self._send_json(payload)
+
+        def do_POST(self):
+            path = urlparse(self.path).path.strip('/')
+            try:
+                if path == 'articles':
+                    length = int(self.headers.get('Content-Length', 0))
+                    articles = json.loads(self.rfile.read(length) or b'[]')
+                    # Індекс пошуку дедуплікує статті за url, тому з ним url обов'язковий
+                    articles_df = articles_from_payload(articles, require_url=service.search_index is not None)
+                    ingested = service.ingest(articles_df)
+                    self._send_json({'ingested': ingested})
+                elif path == 'report':
+                    self._send_json({'report': service.write_report()})
+                else:
+                    self._send_json({'error': f'Невідомий ендпоінт /{path}'}, status=404)
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json({'error': str(e)}, status=400)
+            except OSError as e:
+                # Запис індексу чи звіту на диск: помилка сервера, а не запиту
+                self._send_json({'error': str(e)}, status=500)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def ingest_csv(service, csv_path, batch_size):
+    for batch in iter_article_batches(csv_path, batch_rows=batch_size):
+        service.ingest(batch)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Сервіс інкрементального аналізу новин")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8050)
+    arg_parser.add_argument('--csv', help="CSV з уже спарсеними статтями для початкового завантаження")
+    arg_parser.add_argument('--batch-size', type=int, default=500)
+    arg_parser.add_argument('--crawl', action='store_true', help="Запустити парсер і обробляти статті по мірі парсингу")
+    arg_parser.add_argument('--stop-words', default='data/ukrainian_stopwords.txt')
+    arg_parser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'], default='spacy')
+    arg_parser.add_argument('--tone-dict', default='data/tone_dict_uk.tsv')
+    arg_parser.add_argument('--manipulation-words', default='data/manipulation_words.txt')
+    arg_parser.add_argument('--duplicate-threshold', type=float, default=0.9)
+    arg_parser.add_argument('--index-dir', help="Каталог інвертованого індексу, який оновлюється новими статтями")
+    args = arg_parser.parse_args()
+
+    preprocess = make_preprocessor(args.lemmatizer, args.stop_words)
+    service = NewsAnalysisService(
+        preprocess=preprocess,
+        nlp_ner_model=load_ner_model(),
+        SIA_model=load_sentiment_analyzer(args.tone_dict),
+        manipulative_automaton=PhraseAutomaton(load_manipulative_phrases(args.manipulation_words, preprocess)),
+        duplicate_threshold=args.duplicate_threshold,
+        search_index=InvertedIndex(args.index_dir) if args.index_dir else None,
+    )
+
+    # Завантаження даних іде у фоні, API доступне одразу
+    if args.csv:
+        threading.Thread(target=ingest_csv, args=(service, args.csv, args.batch_size), daemon=True).start()
+    if args.crawl:
+        from parser import parse_all_sites
+        threading.Thread(target=parse_all_sites, kwargs={'on_batch': service.ingest}, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f'Сервіс аналізу доступний на http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
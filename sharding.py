@@ -0,0 +1,342 @@
+"""
+Шардоване виконання аналізу (map-reduce) на кількох процесах або машинах зі спільним каталогом.
+
+partition — корпус з CSV читається порціями і розкладається на шарди за датою та сайтом:
+    shared_dir/shards/<шард>/part-*.parquet, список шардів у shards.json, налаштування в job.json.
+    Непорожній каталог від попередньої задачі не перевикористовується: partition відмовляється
+    в нього писати, а з --overwrite спершу прибирає старі шарди, результати і lock-файли.
+worker — бере вільні шарди (захоплення через атомарне створення lock-файлу), лематизує статті,
+    рахує NER, тональність і маніпулятивність і зберігає частковий AnalysisAggregates
+    у shared_dir/partials/<шард>.pkl. Воркерів можна запускати скільки завгодно і де завгодно,
+    аби вони бачили shared_dir. Lock старший за --lock-timeout вважається покинутим і перехоплюється.
+    Кожен частковий результат позначений job_id з job.json, тож reduce не змішає його з іншою задачею.
+reduce — зливає всі часткові результати (лічильники, гістограми, тональність по днях, топ-списки,
+    кандидатів у копіпаст з порівнянням між шардами) і пише звичайний звіт generate_markdown_report.
+run-local — усе разом на одній машині: N процесів-воркерів і тимчасовий спільний каталог.
+
+Приклади:
+    python sharding.py partition --csv parsed_articles.csv --shared-dir /mnt/news_job --by week
+    python sharding.py worker --shared-dir /mnt/news_job          # на кожній машині
+    python sharding.py reduce --shared-dir /mnt/news_job --output-dir report_job
+    python sharding.py run-local --csv parsed_articles.csv --workers 4 --lemmatizer pymorphy
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+SHARDS_DIR = 'shards'
+PARTIALS_DIR = 'partials'
+LOCKS_DIR = 'locks'
+JOB_NAME = 'job.json'
+MANIFEST_NAME = 'shards.json'
+
+
+def _write_json(path, payload):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def shard_key(dates, urls, by='day'):
+    """Ідентифікатори шардів '<початок періоду>_<сайт>' для колонок date і url."""
+    import pandas as pd
+    from tools import site_from_url
+
+    days = pd.to_datetime(dates).dt.normalize()
+    if by == 'week':
+        days = days - pd.to_timedelta(days.dt.weekday, unit='D')
+    return days.dt.strftime('%Y-%m-%d') + '_' + urls.map(site_from_url).astype(str)
+
+
+# ------------------------- partition -------------------------
+def _clear_job(shared_dir, overwrite):
+    """Старі шарди і результати в shared_dir зіпсували б звіт нової задачі: відмова або очищення."""
+    leftovers = [name for name in [SHARDS_DIR, PARTIALS_DIR, LOCKS_DIR, JOB_NAME, MANIFEST_NAME]
+                 if os.path.exists(os.path.join(shared_dir, name))]
+    if leftovers and not overwrite:
+        raise FileExistsError(f"{shared_dir} уже містить задачу ({', '.join(leftovers)}); "
+                              f"вкажіть інший каталог або --overwrite")
+    for name in leftovers:
+        path = os.path.join(shared_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def partition(csv_path, shared_dir, by='day', batch_rows=5000, job=None, overwrite=False):
+    """
+    Розкладає корпус на шарди у shared_dir і записує маніфест shards.json.
+    Каталог з попередньою задачею очищується лише з overwrite, інакше FileExistsError.
+    """
+    from tools import iter_article_batches
+
+    _clear_job(shared_dir, overwrite)
+    os.makedirs(os.path.join(shared_dir, SHARDS_DIR), exist_ok=True)
+    for name in [PARTIALS_DIR, LOCKS_DIR]:
+        os.makedirs(os.path.join(shared_dir, name), exist_ok=True)
+
+    counts = {}
+    for batch_number, batch in enumerate(iter_article_batches(csv_path, batch_rows=batch_rows)):
+        batch = batch.dropna(subset=['date', 'url'])
+        for shard, shard_df in batch.groupby(shard_key(batch['date'], batch['url'], by)):
+            shard_dir = os.path.join(shared_dir, SHARDS_DIR, shard)
+            os.makedirs(shard_dir, exist_ok=True)
+            shard_df.to_parquet(os.path.join(shard_dir, f'part-{batch_number:05d}.parquet'), index=False)
+            counts[shard] = counts.get(shard, 0) + len(shard_df)
+
+    _write_json(os.path.join(shared_dir, JOB_NAME), dict(job or {}, by=by, job_id=uuid.uuid4().hex))
+    _write_json(os.path.join(shared_dir, MANIFEST_NAME), {shard: counts[shard] for shard in sorted(counts)})
+    return counts
+
+
+# ------------------------- worker -------------------------
+def _claim(shared_dir, shard, lock_timeout):
+    """Атомарно створює lock-файл шарду; True, якщо шард дістався цьому воркеру."""
+    lock_path = os.path.join(shared_dir, LOCKS_DIR, shard + '.lock')
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                stale = time.time() - os.path.getmtime(lock_path) > lock_timeout
+            except FileNotFoundError:
+                continue
+            if not stale:
+                return False
+            # Воркер, що тримав шард, вважається мертвим: прибираємо lock і пробуємо ще раз.
+            # Якщо шард при цьому оброблять двічі, це нешкідливо: результат той самий, а запис атомарний
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(f'{socket.gethostname()}:{os.getpid()}\n')
+        return True
+    return False
+
+
+def partial_path(shared_dir, shard):
+    return os.path.join(shared_dir, PARTIALS_DIR, shard + '.pkl')
+
+
+def _job_id(shared_dir):
+    return _read_json(os.path.join(shared_dir, JOB_NAME)).get('job_id')
+
+
+def process_shard(shared_dir, shard, preprocess, nlp_ner_model, SIA_model, manipulative_automaton,
+                  duplicate_threshold=0.9, job_id=None):
+    """
+    Map-крок для одного шарду: {'job_id', 'aggregates'} у partials/<шард>.pkl.
+    Якщо поки шард рахувався, каталог переділили під іншу задачу, результат не публікується.
+    """
+    import pandas as pd
+    from aggregates import AnalysisAggregates, enrich_batch
+
+    shard_df = pd.read_parquet(os.path.join(shared_dir, SHARDS_DIR, shard))
+    aggregates = AnalysisAggregates(duplicate_threshold=duplicate_threshold,
+                                    manipulative_dictionary_size=len(manipulative_automaton))
+    aggregates.update(enrich_batch(shard_df, preprocess, nlp_ner_model, SIA_model, manipulative_automaton))
+
+    # Спершу у тимчасовий файл: reduce бачить лише повністю записані результати
+    path = partial_path(shared_dir, shard)
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'job_id': job_id, 'aggregates': aggregates}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    if _job_id(shared_dir) != job_id:
+        os.remove(tmp_path)
+        raise RuntimeError(f"Каталог {shared_dir} переділено під іншу задачу, шард {shard} не записано")
+    os.replace(tmp_path, path)
+    return aggregates.n_articles
+
+
+def run_worker(shared_dir, preprocess, nlp_ner_model, SIA_model, manipulative_automaton,
+               duplicate_threshold=0.9, lock_timeout=3600):
+    """Обробляє шарди, доки є незахоплені й необроблені. Повертає список оброблених шардів."""
+    job_id = _job_id(shared_dir)
+    done = []
+    for shard in _read_json(os.path.join(shared_dir, MANIFEST_NAME)):
+        if os.path.exists(partial_path(shared_dir, shard)) or not _claim(shared_dir, shard, lock_timeout):
+            continue
+        # Шард міг бути завершений іншим воркером між перевіркою і захопленням lock-файлу
+        if os.path.exists(partial_path(shared_dir, shard)):
+            continue
+
+        start = time.perf_counter()
+        n_articles = process_shard(shared_dir, shard, preprocess, nlp_ner_model, SIA_model,
+                                   manipulative_automaton, duplicate_threshold, job_id)
+        done.append(shard)
+        print(f'[{socket.gethostname()}:{os.getpid()}] шард {shard}: {n_articles} статей '
+              f'за {time.perf_counter() - start:.1f} с', flush=True)
+    return done
+
+
+def load_job_models(job):
+    """Моделі та словники воркера з налаштувань job.json, однакові для всіх воркерів."""
+    from tools import (
+        make_preprocessor, load_ner_model, load_sentiment_analyzer, load_manipulative_phrases, PhraseAutomaton
+    )
+
+    preprocess = make_preprocessor(job['lemmatizer'], job['stop_words'])
+    return (
+        preprocess,
+        load_ner_model(),
+        load_sentiment_analyzer(job['tone_dict']),
+        PhraseAutomaton(load_manipulative_phrases(job['manipulation_words'], preprocess)),
+    )
+
+
+# ------------------------- reduce -------------------------
+def reduce_partials(shared_dir, allow_missing=False):
+    """
+    Зливає часткові результати в порядку маніфесту. Без allow_missing усі шарди мають бути оброблені.
+    Результат з чужим job_id (від попередньої задачі в тому ж каталозі) — помилка.
+    """
+    from aggregates import AnalysisAggregates
+
+    shards = _read_json(os.path.join(shared_dir, MANIFEST_NAME))
+    missing = [shard for shard in shards if not os.path.exists(partial_path(shared_dir, shard))]
+    if missing and not allow_missing:
+        raise RuntimeError(f"Не оброблено {len(missing)} з {len(shards)} шардів, наприклад {missing[0]}")
+
+    job = _read_json(os.path.join(shared_dir, JOB_NAME))
+    merged = AnalysisAggregates(duplicate_threshold=job.get('duplicate_threshold', 0.9))
+    for shard in shards:
+        if shard in missing:
+            continue
+        with open(partial_path(shared_dir, shard), 'rb') as f:
+            partial = pickle.load(f)
+        if not isinstance(partial, dict) or partial.get('job_id') != job.get('job_id'):
+            raise RuntimeError(f"Результат шарду {shard} належить іншій задачі, ніж {JOB_NAME}; "
+                               f"переділіть каталог через partition --overwrite")
+        merged.merge(partial['aggregates'])
+    return merged, missing
+
+
+def write_report(aggregates, output_dir='.'):
+    import matplotlib
+    matplotlib.use('Agg')
+    from report_generator import generate_markdown_report
+
+    return generate_markdown_report(None, aggregates.figures(), aggregates.texts(),
+                                    summary=aggregates.summary(), output_dir=output_dir)
+
+
+# ------------------------- CLI -------------------------
+def _add_job_arguments(subparser):
+    subparser.add_argument('--csv', default='parsed_articles.csv')
+    subparser.add_argument('--by', choices=['day', 'week'], default='day', help="Період одного шарду")
+    subparser.add_argument('--batch-size', type=int, default=5000)
+    subparser.add_argument('--lemmatizer', choices=['spacy', 'pymorphy'], default='spacy')
+    subparser.add_argument('--stop-words', default='data/ukrainian_stopwords.txt')
+    subparser.add_argument('--tone-dict', default='data/tone_dict_uk.tsv')
+    subparser.add_argument('--manipulation-words', default='data/manipulation_words.txt')
+    subparser.add_argument('--duplicate-threshold', type=float, default=0.9)
+    subparser.add_argument('--overwrite', action='store_true',
+                           help="Очистити --shared-dir від попередньої задачі (шарди, результати, lock-файли)")
+
+
+def _job_from_args(args):
+    # Шляхи абсолютні, бо воркери можуть стартувати з інших каталогів
+    return {
+        'lemmatizer': args.lemmatizer,
+        'stop_words': os.path.abspath(args.stop_words),
+        'tone_dict': os.path.abspath(args.tone_dict),
+        'manipulation_words': os.path.abspath(args.manipulation_words),
+        'duplicate_threshold': args.duplicate_threshold,
+    }
+
+
+def _worker_main(shared_dir, lock_timeout):
+    job = _read_json(os.path.join(shared_dir, JOB_NAME))
+    run_worker(shared_dir, *load_job_models(job), duplicate_threshold=job['duplicate_threshold'],
+               lock_timeout=lock_timeout)
+
+
+def _reduce_main(shared_dir, output_dir, allow_missing):
+    start = time.perf_counter()
+    try:
+        aggregates, missing = reduce_partials(shared_dir, allow_missing)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    report_path = write_report(aggregates, output_dir)
+    print(f'Злито {aggregates.n_articles} статей за {time.perf_counter() - start:.1f} с'
+          + (f', пропущено шардів: {len(missing)}' if missing else '') + f'. Звіт: {report_path}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Шардований аналіз новин (map-reduce через спільний каталог)")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    partition_parser = subparsers.add_parser('partition', help="Розкласти корпус на шарди")
+    partition_parser.add_argument('--shared-dir', required=True)
+    _add_job_arguments(partition_parser)
+
+    worker_parser = subparsers.add_parser('worker', help="Обробляти шарди, доки вони є")
+    worker_parser.add_argument('--shared-dir', required=True)
+    worker_parser.add_argument('--lock-timeout', type=float, default=3600,
+                               help="Через скільки секунд чужий lock вважати покинутим")
+
+    reduce_parser = subparsers.add_parser('reduce', help="Злити часткові результати і згенерувати звіт")
+    reduce_parser.add_argument('--shared-dir', required=True)
+    reduce_parser.add_argument('--output-dir', default='.')
+    reduce_parser.add_argument('--allow-missing', action='store_true', help="Звіт навіть без частини шардів")
+
+    local_parser = subparsers.add_parser('run-local', help="partition + N воркерів + reduce на цій машині")
+    local_parser.add_argument('--shared-dir', help="За замовчуванням — тимчасовий каталог")
+    local_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    local_parser.add_argument('--output-dir', default='.')
+    _add_job_arguments(local_parser)
+
+    args = arg_parser.parse_args()
+
+    if args.command == 'partition':
+        try:
+            counts = partition(args.csv, args.shared_dir, args.by, args.batch_size, _job_from_args(args),
+                               args.overwrite)
+        except FileExistsError as e:
+            raise SystemExit(str(e))
+        print(f'{sum(counts.values())} статей розкладено на {len(counts)} шардів у {args.shared_dir}')
+
+    elif args.command == 'worker':
+        _worker_main(args.shared_dir, args.lock_timeout)
+
+    elif args.command == 'reduce':
+        _reduce_main(args.shared_dir, args.output_dir, args.allow_missing)
+
+    elif args.command == 'run-local':
+        with tempfile.TemporaryDirectory(prefix='news_shards_') as tmp_dir:
+            shared_dir = args.shared_dir or tmp_dir
+            try:
+                counts = partition(args.csv, shared_dir, args.by, args.batch_size, _job_from_args(args),
+                                   args.overwrite)
+            except FileExistsError as e:
+                raise SystemExit(str(e))
+            print(f'{sum(counts.values())} статей розкладено на {len(counts)} шардів у {shared_dir}')
+
+            # Окремі процеси, як і на різних машинах: спільний лише каталог
+            workers = [subprocess.Popen([sys.executable, __file__, 'worker', '--shared-dir', shared_dir])
+                       for _ in range(args.workers)]
+            if any([worker.wait() != 0 for worker in workers]):
+                raise SystemExit("Один із воркерів завершився з помилкою")
+
+            _reduce_main(shared_dir, args.output_dir, allow_missing=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,226 @@
 import pandas as pd
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from collections import Counter
+from functools import lru_cache
+from collections import Counter, deque
 import re
 import gc
-import matplotlib.pyplot as plt
-import seaborn as sns
-from wordcloud import WordCloud
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+# matplotlib, seaborn, wordcloud, sklearn, nltk і scipy імпортуються всередині функцій, які їх використовують:
+# разом вони займають кілька секунд, а швидким командам (main.py report, analyze --only ...) потрібні не всі.
+
+
+# ------------------------- Завантаження моделей та словників -------------------------
+def load_preprocess_model(stop_words_path):
+    """Пайплайн spaCy для лематизації з доданими кастомними стоп-словами."""
+    import spacy
+
+    try:
+        nlp_preprocess = spacy.load("uk_core_news_lg")
+    except OSError:
+        import subprocess
+        import sys
+        subprocess.run([sys.executable, "-m", "spacy", "download", "uk_core_news_lg"])
+        nlp_preprocess = spacy.load("uk_core_news_lg")
+
+    # Відключаємо ВСЕ окрім токенізатора та лематизатора
+    pipes_to_disable = []
+    for name, _ in nlp_preprocess.pipeline:
+        if name not in ['tok2vec', 'lemmatizer']:  # Потрібні для лематизації
+            pipes_to_disable.append(name)
+    print(f"Відключаємо пайпи: {pipes_to_disable}")
+    nlp_preprocess.disable_pipes(*pipes_to_disable)
+
+    # Додаємо кастомні стоп-слова до стандартних стоп-слів spaCy
+    for word in load_stop_words(stop_words_path):
+        nlp_preprocess.vocab[word].is_stop = True
+
+    return nlp_preprocess
+
+
+def load_ner_model():
+    """Пайплайн spaCy тільки з NER."""
+    import spacy
+
+    nlp_ner = spacy.load("uk_core_news_lg")
+    nlp_ner.disable_pipes(["tok2vec", "morphologizer", "lemmatizer", "attribute_ruler"])
+    return nlp_ner
+
+
+def load_stop_words(stop_words_path):
+    with open(stop_words_path, 'r', encoding='utf-8-sig') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def load_sentiment_analyzer(tone_dict_path):
+    """VADER з доповненим українським словником тональності."""
+    from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+    # Читаємо словник одразу в dict
+    tone_dict = pd.read_csv(tone_dict_path, delimiter='\t', header=None,
+                            names=['word', 'score']).set_index('word')['score'].to_dict()
+
+    SIA = SentimentIntensityAnalyzer()
+    SIA.lexicon.update(tone_dict)
+    return SIA
+
+
+def _arrow_types_mapper(arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def _article_convert_options():
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    # Дата в наносекундах з ISO8601-парсером: так читаються і секунди ('2024-11-10 12:05:00' з save_articles),
+    # і дробові частки до наносекунд, які пише pandas з datetime64[ns] (старі CSV з quoting=1)
+    return pa_csv.ConvertOptions(
+        column_types={
+            'title': pa.string(),
+            'url': pa.string(),
+            'text': pa.string(),
+            'date': pa.timestamp('ns'),
+        },
+        timestamp_parsers=[pa_csv.ISO8601],
+        strings_can_be_null=True,
+    )
+
+
+def load_articles(csv_path):
+    """
+    Читає parsed_articles.csv CSV-рідером pyarrow (багатопотоково).
+    Текстові колонки одразу мають тип string[pyarrow], а дата парситься при читанні.
+    """
+    from pyarrow import csv as pa_csv
+
+    table = pa_csv.read_csv(csv_path, convert_options=_article_convert_options())
+    return table.to_pandas(types_mapper=_arrow_types_mapper)
+
+
+def iter_article_batches(csv_path, batch_rows=5000, block_size=16 << 20):
+    """
+    Потоково читає parsed_articles.csv порціями по batch_rows статей (остання може бути меншою).
+    У пам'яті одночасно тримається лише одна порція та один блок CSV розміром block_size байт.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    reader = pa_csv.open_csv(csv_path,
+                             read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=_article_convert_options())
+    pending = pa.Table.from_batches([], schema=reader.schema)
+    for record_batch in reader:
+        pending = pa.concat_tables([pending, pa.Table.from_batches([record_batch])])
+        while pending.num_rows >= batch_rows:
+            yield pending.slice(0, batch_rows).to_pandas(types_mapper=_arrow_types_mapper)
+            pending = pending.slice(batch_rows)
+
+    if pending.num_rows:
+        yield pending.to_pandas(types_mapper=_arrow_types_mapper)
+
+
+def save_processed_articles(news_df, parquet_path, lemmatizer=None):
+    """
+    Зберігає оброблений корпус (зі списками лем) у parquet, щоб аналізи не лематизували його заново.
+    Назва лематизатора пишеться в метадані файлу: ним же потім нормалізується словник маніпуляцій.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(news_df, preserve_index=False)
+    if lemmatizer:
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {}, lemmatizer=lemmatizer))
+    pq.write_table(table, parquet_path)
+
+
+def load_processed_lemmatizer(parquet_path):
+    """Лематизатор, яким оброблено корпус (None для файлів, збережених без нього)."""
+    import pyarrow.parquet as pq
+
+    lemmatizer = (pq.read_schema(parquet_path).metadata or {}).get(b'lemmatizer')
+    return lemmatizer.decode() if lemmatizer else None
+
+
+def load_processed_articles(parquet_path, columns=None):
+    import pyarrow.parquet as pq
+
+    news_df = pq.read_table(parquet_path, columns=columns).to_pandas(types_mapper=_arrow_types_mapper)
+    # Списки з parquet приходять як numpy-масиви, повертаємо звичайні списки лем
+    for column in ['processed_title', 'processed_text', 'lemma_stream']:
+        if column in news_df:
+            news_df[column] = news_df[column].map(list)
+    return news_df
+
+
+def load_manipulative_lemmas(manipulative_words_path):
+    # utf-8-sig, бо словник може починатись з BOM
+    with open(manipulative_words_path, "r", encoding="utf-8-sig") as f:
+        return set(line.strip() for line in f if line.strip())
 
 
 # ------------------------- Функції обробки тексту -------------------------
-def preprocess_text(text, nlp_model):
-    if isinstance(text, float):
-        return []
+def site_from_url(url):
+    """Домен сайту без www, наприклад 'pravda.com.ua'."""
+    from urllib.parse import urlparse
+
+    netloc = urlparse(str(url)).netloc.lower()
+    return netloc[4:] if netloc.startswith('www.') else netloc
+
+
+def _is_missing(text):
+    # NaN у object-колонках, pd.NA у string[pyarrow]
+    return text is None or text is pd.NA or isinstance(text, float)
+
+
+def clean_text_column(texts, chunk_size=10000):
+    """
+    Векторизована версія очистки з preprocess_text на Arrow compute kernels:
+    обрізання, заміна всього крім літер/цифр/пробілів на пробіл, нижній регістр.
+    Результат можна передавати в preprocess_text(..., cleaned=True).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    array = pa.chunked_array(pa.array(texts.astype(pd.StringDtype('pyarrow'))))
+
+    # Обробляємо шматками, щоб проміжні масиви kernel-ів не роздували пікову пам'ять
+    cleaned_chunks = []
+    for start in range(0, len(array), chunk_size):
+        chunk = array.slice(start, chunk_size)
+        if (pc.max(pc.utf8_length(chunk)).as_py() or 0) > 999999:
+            chunk = pc.utf8_slice_codeunits(chunk, 0, 999999)
+        # RE2 не знає юнікодного \w, тому перелічуємо класи явно
+        chunk = pc.replace_substring_regex(chunk, r'[^\p{L}\p{N}_\s]', ' ')
+        cleaned_chunks.extend(pc.utf8_trim_whitespace(pc.utf8_lower(chunk)).chunks)
+    array = pa.chunked_array(cleaned_chunks, type=array.type)
+
+    return pd.Series(pd.arrays.ArrowStringArray(array), index=texts.index, name=texts.name)
+
 
-    # Попередня очистка та обрізання
+def preprocess_text(text, nlp_model, cleaned=False, with_stream=False):
+    """
+    Леми тексту без стоп-слів. З with_stream=True повертає пару (леми, потік лем): потік —
+    усі леми підряд, разом зі стоп-словами, з того самого проходу spaCy. По ньому шукаються
+    багатослівні маніпулятивні вирази («як відомо»), які без стоп-слів злипаються в одне слово.
+    """
+    empty = ([], []) if with_stream else []
+    if _is_missing(text):
+        return empty
+
+    # Попередня очистка та обрізання (пропускаємо, якщо вже зроблено clean_text_column)
     text = str(text)
-    if len(text) > 999999:
-        text = text[:999999]
+    if not cleaned:
+        if len(text) > 999999:
+            text = text[:999999]
 
-    text = re.sub(r'[^\w\s]', ' ', text).lower().strip()
+        text = re.sub(r'[^\w\s]', ' ', text).lower().strip()
 
     if not text:
-        return []
+        return empty
 
     try:
         doc = nlp_model(text)
@@ -35,15 +232,17 @@ def preprocess_text(text, nlp_model):
                and not token.is_space
                and len(token.lemma_.strip()) > 1
         ]
+        if with_stream:
+            return tokens, [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
         return tokens
     except Exception as e:
         print(f"Помилка обробки тексту довжиною {len(text)}: {e}")
-        return []
+        return empty
 
 
 def extract_entities(text, nlp_ner_model):
     # Перевірка на NaN
-    if isinstance(text, float):
+    if _is_missing(text):
         return []
 
     doc = nlp_ner_model(text)
@@ -51,6 +250,83 @@ def extract_entities(text, nlp_ner_model):
     return entities
 
 
+class MorphLemmatizer:
+    """
+    Легка альтернатива spaCy-пайплайну: regex-токенізатор + pymorphy3.
+    Лексика новин має ципфів розподіл, тому леми словоформ кешуються в обмеженому LRU.
+    """
+
+    _word_re = re.compile(r'\w+')
+
+    def __init__(self, stop_words, cache_size=200000):
+        import pymorphy3
+
+        self.morph = pymorphy3.MorphAnalyzer(lang='uk')
+
+        # Стандартні стоп-слова spaCy, щоб обидва режими відкидали однакові слова
+        try:
+            from spacy.lang.uk.stop_words import STOP_WORDS
+        except ImportError:
+            STOP_WORDS = set()
+        self.stop_words = set(STOP_WORDS) | set(stop_words)
+
+        self.lemmatize = lru_cache(maxsize=cache_size)(self._lemmatize)
+
+    def _lemmatize(self, word):
+        return self.morph.parse(word)[0].normal_form
+
+    def __call__(self, text):
+        return [
+            lemma
+            for lemma in (self.lemmatize(word) for word in self._word_re.findall(text) if word not in self.stop_words)
+            if len(lemma.strip()) > 1
+        ]
+
+    def with_stream(self, text):
+        """Пара (леми без стоп-слів, усі леми підряд) за один прохід, як preprocess_text(with_stream=True)."""
+        tokens, stream = [], []
+        for word in self._word_re.findall(text):
+            lemma = self.lemmatize(word)
+            stream.append(lemma)
+            if word not in self.stop_words and len(lemma.strip()) > 1:
+                tokens.append(lemma)
+        return tokens, stream
+
+
+def preprocess_text_morph(text, lemmatizer, cleaned=False, with_stream=False):
+    """Те саме, що preprocess_text, але через MorphLemmatizer замість spaCy."""
+    empty = ([], []) if with_stream else []
+    if _is_missing(text):
+        return empty
+
+    text = str(text)
+    if not cleaned:
+        if len(text) > 999999:
+            text = text[:999999]
+
+        text = re.sub(r'[^\w\s]', ' ', text).lower().strip()
+
+    if not text:
+        return empty
+    return lemmatizer.with_stream(text) if with_stream else lemmatizer(text)
+
+
+def make_preprocessor(backend, stop_words_path):
+    """
+    Повертає функцію (text, cleaned=False, with_stream=False) -> список лем для обраного режиму
+    лематизації: 'spacy' — повний пайплайн uk_core_news_lg, 'pymorphy' — regex-токенізатор + pymorphy3.
+    """
+    if backend == 'spacy':
+        nlp_preprocess = load_preprocess_model(stop_words_path)
+        return lambda text, cleaned=False, with_stream=False: preprocess_text(text, nlp_preprocess, cleaned,
+                                                                              with_stream)
+    if backend == 'pymorphy':
+        lemmatizer = MorphLemmatizer(load_stop_words(stop_words_path))
+        return lambda text, cleaned=False, with_stream=False: preprocess_text_morph(text, lemmatizer, cleaned,
+                                                                                    with_stream)
+    raise ValueError(f"Невідомий режим лематизації: {backend}")
+
+
 # Функція для лемматизації та обробки тексту
 def preprocess_and_analyze(text, nlp_model, SIA_model):
     """
@@ -88,6 +364,12 @@ def freq_of_publication_analysis(news_df):
     news_df['hour'] = news_df['date'].dt.hour
     hourly_counts = news_df.groupby('hour').size()
 
+    return plot_hourly_counts(hourly_counts)
+
+
+def plot_hourly_counts(hourly_counts):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(10, 6))
     hourly_counts.plot(kind='bar', ax=ax, color='skyblue', edgecolor='black')
     plt.title('Частота публікацій за годину')
@@ -102,6 +384,9 @@ def freq_of_publication_analysis(news_df):
 
 # ------------------------- 2) Аналіз найчастіше вживаних слів (word cloud) -------------------------
 def words_freq_analysis(news_df):
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
     # Об'єднуємо всі оброблені тексти в один
     all_words = ' '.join([word for tokens in news_df['processed_text'] for word in tokens])
 
@@ -131,16 +416,12 @@ def analyze_sentiment_from_tokens(tokens, SIA_model):
     return SIA_model.polarity_scores(processed_text)["compound"]
 
 
-def tonality_analysis_VADER(news_df, load_new_dict=False):
-    tone_dict_path = '/kaggle/input/ukrainian-tone-dictionary/tone_dict_uk.tsv'
-
-    # Оптимізація 1: читаємо словник одразу в dict
-    tone_dict = pd.read_csv(tone_dict_path, delimiter='\t', header=None,
-                            names=['word', 'score']).set_index('word')['score'].to_dict()
+def tonality_analysis_VADER(news_df, load_new_dict=False,
+                            tone_dict_path='/kaggle/input/ukrainian-tone-dictionary/tone_dict_uk.tsv'):
+    import matplotlib.pyplot as plt
 
-    # Оптимізація 2: створюємо SIA один раз
-    SIA = SentimentIntensityAnalyzer()
-    SIA.lexicon.update(tone_dict)
+    # Створюємо SIA один раз
+    SIA = load_sentiment_analyzer(tone_dict_path)
 
     # Основна обробка
     news_df['sentiment_score'] = news_df['processed_text'].apply(
@@ -156,7 +437,15 @@ def tonality_analysis_VADER(news_df, load_new_dict=False):
     plt.show()
 
     sentiment_by_date = news_df.groupby(news_df['date'].dt.date)['sentiment_score'].mean()
-    fig_2 = plt.figure(figsize=(10, 6))
+    fig_2 = plot_daily_sentiment(sentiment_by_date)
+
+    return fig_1, fig_2
+
+
+def plot_daily_sentiment(sentiment_by_date):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 6))
     plt.plot(range(len(sentiment_by_date)), sentiment_by_date.values, marker='o', color='orange')
     plt.xticks(range(len(sentiment_by_date)), range(1, len(sentiment_by_date) + 1))
     plt.title("Середня тональність новин у часі")
@@ -164,7 +453,7 @@ def tonality_analysis_VADER(news_df, load_new_dict=False):
     plt.ylabel("Середня тональність")
     plt.show()
 
-    return fig_1, fig_2
+    return fig
 
 
 # ------------------------- 4) Візуалізація згадок ключових осіб або подій за допомогою NER -------------------------
@@ -184,6 +473,27 @@ def extract_and_visualize_named_entities(news_df, nlp_ner_model):
 
     gc.collect()
 
+    return plot_entity_cloud(entity_counts)
+
+
+def _empty_cloud_figure(message):
+    """Заглушка замість хмари слів: WordCloud не вміє будувати хмару з порожнього словника частот."""
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 5))
+    plt.text(0.5, 0.5, message, ha='center', va='center', fontsize=14, color='grey')
+    plt.axis('off')
+    return fig
+
+
+def plot_entity_cloud(entity_counts):
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
+    # У малих вибірках (один сайт за день) сутностей може не бути зовсім
+    if not entity_counts:
+        return _empty_cloud_figure("Іменованих сутностей не знайдено")
+
     # Створюємо Word Cloud для згадок іменованих сутностей
     wordcloud = WordCloud(
         width=1000,
@@ -202,6 +512,11 @@ def extract_and_visualize_named_entities(news_df, nlp_ner_model):
 
 # ------------------------- 5) Визначення копіпаст новин з використанням косинусової подібності -------------------------
 def detect_repackaged_news(news_df, threshold=0.9, max_features=50000):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # TF-IDF векторизація
     vectorizer = TfidfVectorizer(max_features=max_features, stop_words=None)
     tfidf_matrix = vectorizer.fit_transform(news_df['text'])
@@ -226,7 +541,7 @@ def detect_repackaged_news(news_df, threshold=0.9, max_features=50000):
                         'similarity': sim_score
                     })
 
-    similar_df = pd.DataFrame(similar_pairs)
+    similar_df = pd.DataFrame(similar_pairs, columns=['index_1', 'index_2', 'title_1', 'title_2', 'similarity'])
 
     # Побудова графіка як об'єкта Figure
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -237,23 +552,37 @@ def detect_repackaged_news(news_df, threshold=0.9, max_features=50000):
     ax.grid(True)
     fig.tight_layout()
 
-    # Текстовий блок
+    top_similar = similar_df.sort_values(by='similarity', ascending=False).head(10)
+    similarity_text_block = repackaged_news_markdown(
+        top_similar[['title_1', 'title_2', 'similarity']].itertuples(index=False),
+        len(similar_df), threshold
+    )
+
+    return fig, similarity_text_block
+
+
+def repackaged_news_markdown(top_pairs, total_pairs, threshold):
+    """top_pairs — ітерабельне з (title_1, title_2, similarity), вже відсортоване."""
     similarity_text_block = "## Виявлення схожих новин (репаковані тексти)\n"
-    similarity_text_block += f"Загалом знайдено {len(similar_df)} пар новин з косинусною подібністю понад {threshold}.\n\n"
+    similarity_text_block += f"Загалом знайдено {total_pairs} пар новин з косинусною подібністю понад {threshold}.\n\n"
     similarity_text_block += "Найбільш схожі пари:\n\n"
 
-    top_similar = similar_df.sort_values(by='similarity', ascending=False).head(10)
-    for _, row in top_similar.iterrows():
+    for title_1, title_2, similarity in top_pairs:
         similarity_text_block += (
-            f"- **{row['title_1']}**\n"
-            f"  ↔ **{row['title_2']}** — подібність: {row['similarity']:.3f}\n"
+            f"- **{title_1}**\n"
+            f"  ↔ **{title_2}** — подібність: {similarity:.3f}\n"
         )
 
-    return fig, similarity_text_block
+    return similarity_text_block
 
 
 # ------------------------- 6) Перевірка клікбейтності новин(порівняння заголовку і тексту) -------------------------
 def analyze_title_text_similarity(news_df, max_features=50000):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # Векторизація заголовків і текстів разом
     all_texts = news_df['title'].tolist() + news_df['text'].tolist()
     vectorizer = TfidfVectorizer(max_features=max_features)
@@ -277,42 +606,131 @@ def analyze_title_text_similarity(news_df, max_features=50000):
     ax.grid(True)
     fig.tight_layout()
 
-    # Формування markdown-блоку
+    suspicious = news_df.sort_values(by='title_text_similarity').head(10)
+    markdown_text = title_text_similarity_markdown(
+        suspicious[['title', 'title_text_similarity']].itertuples(index=False)
+    )
+
+    return fig, markdown_text
+
+
+def title_text_similarity_markdown(suspicious):
+    """suspicious — ітерабельне з (title, similarity), від найменшої схожості."""
     markdown_text = "## Аналіз узгодженості заголовків і текстів\n"
     markdown_text += "Гістограма показує, наскільки заголовки відображають зміст текстів.\n"
     markdown_text += "Нижче наведено 10 новин із найменшою схожістю між заголовком і основним текстом — це потенційно клікбейт:\n\n"
 
-    suspicious = news_df.sort_values(by='title_text_similarity').head(10)
-    for _, row in suspicious.iterrows():
-        markdown_text += f"- **{row['title']}** — схожість: {row['title_text_similarity']:.3f}\n"
+    for title, similarity in suspicious:
+        markdown_text += f"- **{title}** — схожість: {similarity:.3f}\n"
 
-    return fig, markdown_text
+    return markdown_text
 
 
 # ------------------------- 7) Перевірка маніпулятивності новини-------------------------
-def analyze_manipulative_language(news_df, manipulative_words_path):
-    # Завантаження словника
-    with open(manipulative_words_path, "r", encoding="utf-8") as f:
-        manipulative_lemmas = set(line.strip() for line in f if line.strip())
+class PhraseAutomaton:
+    """
+    Автомат Ахо-Корасік над послідовностями лем.
+    За один прохід по токенах знаходить усі входження як окремих лем, так і багатослівних
+    виразів словника, тому час не залежить від кількості фраз у словнику.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # номери фраз, що закінчуються в цьому стані
+
+        for phrase in dict.fromkeys(tuple(phrase) for phrase in phrases if phrase):
+            state = 0
+            for token in phrase:
+                if token not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][token] = len(self.goto) - 1
+                state = self.goto[state][token]
+            self.output[state].append(len(self.phrases))
+            self.phrases.append(phrase)
+
+        # Посилання невдачі будуються обходом у ширину
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def find(self, tokens):
+        """Номери фраз для кожного входження (перекриття враховуються)."""
+        state = 0
+        for token in tokens:
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            yield from self.output[state]
+
+    def count(self, tokens):
+        return Counter(self.find(tokens))
+
+
+def load_manipulative_phrases(manipulative_words_path, preprocess=None):
+    """
+    Словник маніпулятивних виразів як послідовності лем.
+    Рядок словника — одна лема або багатослівний вираз. Якщо передано preprocess
+    (з make_preprocessor), вирази лематизуються так само, як тексти новин, але без видалення
+    стоп-слів: автомат шукає їх у потоці лем (колонка lemma_stream). Інакше вважаються
+    вже лематизованими.
+    """
+    phrases = []
+    for line in sorted(load_manipulative_lemmas(manipulative_words_path)):
+        phrase = preprocess(line, with_stream=True)[1] if preprocess is not None else line.lower().split()
+        if len(phrase) < len(line.split()):
+            print(f"Вираз словника «{line}» після нормалізації скоротився до {phrase}")
+        if phrase:
+            phrases.append(tuple(phrase))
+    return phrases
+
+
+def lemma_stream_column(news_df):
+    """Потік лем зі стоп-словами для пошуку виразів; старі корпуси без нього — processed_text."""
+    if 'lemma_stream' in news_df:
+        return news_df['lemma_stream']
+    print("У корпусі немає колонки lemma_stream (оброблено старою версією), вирази шукаються "
+          "в лемах без стоп-слів — перезапустіть python main.py preprocess")
+    return news_df['processed_text']
+
 
-    # Функція підрахунку
-    def count_manipulative_words(lemmatized_tokens, manip_words_set):
-        return sum(1 for token in lemmatized_tokens if token in manip_words_set)
+def analyze_manipulative_language(news_df, manipulative_words_path, preprocess=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Завантаження словника і побудова автомата
+    manipulative_automaton = PhraseAutomaton(load_manipulative_phrases(manipulative_words_path, preprocess))
 
     # Копія датафрейму
     df = news_df.copy()
 
-    # Обчислення абсолютної кількості
-    df["manipulative_word_count"] = df["processed_text"].apply(
-        lambda tokens: count_manipulative_words(tokens, manipulative_lemmas)
-    )
+    # Один прохід автомата по потоку лем кожної новини: кількість збігів кожної фрази
+    lemmas = lemma_stream_column(df)
+    phrase_hits = lemmas.apply(manipulative_automaton.count)
+    df["manipulative_word_count"] = phrase_hits.apply(lambda hits: sum(hits.values()))
 
-    # Обчислення частки (нормалізація)
-    df["manipulative_ratio"] = df.apply(
-        lambda row: row["manipulative_word_count"] / len(row["processed_text"])
-        if len(row["processed_text"]) > 0 else 0,
-        axis=1
-    )
+    phrase_counts = Counter()
+    for hits in phrase_hits:
+        phrase_counts.update(hits)
+
+    # Обчислення частки (нормалізація) на довжину того ж потоку лем
+    df["manipulative_ratio"] = [
+        count / len(tokens) if len(tokens) > 0 else 0
+        for count, tokens in zip(df["manipulative_word_count"], lemmas)
+    ]
 
     # Візуалізація
     fig, ax = plt.subplots(figsize=(10, 5))
@@ -323,18 +741,194 @@ def analyze_manipulative_language(news_df, manipulative_words_path):
     ax.grid(True)
     fig.tight_layout()
 
-    # Формування тексту
+    top_manip = df.sort_values("manipulative_ratio", ascending=False).head(10)
+    markdown_text = manipulative_language_markdown(
+        top_manip[['title', 'manipulative_word_count', 'manipulative_ratio']].itertuples(index=False),
+        len(manipulative_automaton),
+        phrase_hit_counts(phrase_counts, manipulative_automaton)
+    )
+
+    return fig, markdown_text
+
+
+def phrase_hit_counts(phrase_counts, manipulative_automaton):
+    """Counter номерів фраз -> Counter самих виразів (рядків)."""
+    return Counter({" ".join(manipulative_automaton.phrases[phrase_id]): count
+                    for phrase_id, count in phrase_counts.items()})
+
+
+def manipulative_language_markdown(top_manip, dictionary_size, phrase_counts=None, top_phrases=15):
+    """top_manip — ітерабельне з (title, manipulative_word_count, manipulative_ratio)."""
     markdown_text = "## Аналіз маніпулятивної лексики\n"
     markdown_text += (
-        f"Загальна кількість слів у словнику: {len(manipulative_lemmas)}.\n\n"
+        f"Загальна кількість слів і виразів у словнику: {dictionary_size}.\n\n"
         "Оцінено частку маніпулятивних лем у кожній новині. Нижче — заголовки з найбільшої кількістю співпадінь:\n\n"
     )
 
-    top_manip = df.sort_values("manipulative_ratio", ascending=False).head(10)
-    for _, row in top_manip.iterrows():
+    for title, count, ratio in top_manip:
         markdown_text += (
-            f"- **{row['title']}** — {row['manipulative_word_count']} маніпулятивних слів "
-            f"({row['manipulative_ratio']:.2%})\n"
+            f"- **{title}** — {count} маніпулятивних слів "
+            f"({ratio:.2%})\n"
         )
 
+    if phrase_counts:
+        markdown_text += "\nНайчастіші маніпулятивні слова та вирази:\n\n"
+        for phrase, count in phrase_counts.most_common(top_phrases):
+            markdown_text += f"- {phrase} — {count}\n"
+
+    return markdown_text
+
+
+# ------------------------- 8) Мережа спільних згадувань сутностей -------------------------
+def build_entity_incidence(entities_lists, min_df=1):
+    """
+    Бінарна розріджена матриця документ × сутність та назви її стовпців.
+    Сутності, що зустрічаються менше ніж у min_df документах, відкидаються.
+    """
+    from scipy import sparse
+
+    entities_lists = pd.Series(list(entities_lists), dtype=object)
+    exploded = entities_lists.explode().dropna()
+    codes, names = pd.factorize(exploded)
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int32), (exploded.index.to_numpy(), codes)),
+        shape=(len(entities_lists), len(names))
+    )
+    incidence.data[:] = 1  # Повтори сутності в одній новині рахуємо один раз
+
+    doc_freq = np.asarray(incidence.sum(axis=0)).ravel()
+    keep = np.flatnonzero(doc_freq >= min_df)
+    return incidence[:, keep].tocsr(), np.asarray(names)[keep]
+
+
+def cooccurrence_edges(incidence, names, top_k=30, min_count=2, sort_by='count'):
+    """
+    Пари сутностей, що згадуються в одних новинах: кількість спільних новин і PMI.
+    Усі пари рахуються одним розрідженим добутком X^T X, без циклу по парах.
+    """
+    from scipy import sparse
+
+    n_docs = incidence.shape[0]
+    cooccurrence = (incidence.T @ incidence).tocsr()
+    doc_freq = cooccurrence.diagonal()
+
+    # Верхній трикутник без діагоналі — кожна пара один раз
+    pairs = sparse.triu(cooccurrence, k=1).tocoo()
+    mask = pairs.data >= min_count
+    rows, cols, counts = pairs.row[mask], pairs.col[mask], pairs.data[mask]
+    pmi = np.log(counts * n_docs / (doc_freq[rows].astype(float) * doc_freq[cols]))
+
+    scores = counts if sort_by == 'count' else pmi
+    if len(scores) > top_k:
+        top = np.argpartition(scores, -top_k)[-top_k:]
+        rows, cols, counts, pmi, scores = rows[top], cols[top], counts[top], pmi[top], scores[top]
+    order = np.argsort(scores)[::-1]
+
+    return pd.DataFrame({
+        'entity_1': names[rows[order]],
+        'entity_2': names[cols[order]],
+        'count': counts[order],
+        'pmi': pmi[order],
+    })
+
+
+def cooccurrence_edges_by_day(news_df, incidence, names, top_k=5, min_count=2):
+    """Топ пар для кожного дня: рядки матриці інцидентності просто зрізаються по датах."""
+    days = news_df['date'].dt.date.to_numpy()
+    edges_by_day = {}
+    for day in sorted(set(days)):
+        rows = np.flatnonzero(days == day)
+        edges_by_day[day] = cooccurrence_edges(incidence[rows], names, top_k=top_k, min_count=min_count)
+    return edges_by_day
+
+
+def plot_cooccurrence_graph(edges):
+    """Граф спільних згадувань: вузли по колу, товщина ребра пропорційна кількості спільних новин."""
+    import matplotlib.pyplot as plt
+
+    nodes = list(dict.fromkeys(edges['entity_1'].tolist() + edges['entity_2'].tolist()))
+    angles = np.linspace(0, 2 * np.pi, len(nodes), endpoint=False)
+    positions = {node: (np.cos(angle), np.sin(angle)) for node, angle in zip(nodes, angles)}
+    degree = Counter(edges['entity_1'].tolist() + edges['entity_2'].tolist())
+    max_count = edges['count'].max() if len(edges) else 1
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    for entity_1, entity_2, count in edges[['entity_1', 'entity_2', 'count']].itertuples(index=False):
+        (x1, y1), (x2, y2) = positions[entity_1], positions[entity_2]
+        ax.plot([x1, x2], [y1, y2], color='steelblue', alpha=0.6, linewidth=0.5 + 4 * count / max_count)
+    for node, (x, y) in positions.items():
+        ax.scatter(x, y, s=100 + 80 * degree[node], color='darkorange', edgecolor='black', zorder=3)
+        ax.annotate(node, (x, y), xytext=(x * 1.12, y * 1.12), ha='center', va='center', fontsize=9)
+
+    ax.set_title("Мережа спільних згадувань сутностей")
+    ax.set_xlim(-1.4, 1.4)
+    ax.set_ylim(-1.4, 1.4)
+    ax.axis('off')
+    fig.tight_layout()
+
+    return fig
+
+
+def entity_cooccurrence_analysis(news_df, top_k=30, min_count=2, top_k_per_day=3):
+    """Потребує колонки entities (її додає extract_and_visualize_named_entities)."""
+    incidence, names = build_entity_incidence(news_df['entities'], min_df=min_count)
+    edges = cooccurrence_edges(incidence, names, top_k=top_k, min_count=min_count)
+    edges_by_day = cooccurrence_edges_by_day(news_df, incidence, names, top_k=top_k_per_day, min_count=min_count)
+
+    fig = plot_cooccurrence_graph(edges)
+
+    markdown_text = "## Спільні згадування сутностей\n"
+    markdown_text += (
+        f"Проаналізовано {len(names)} сутностей, що згадуються щонайменше в {min_count} новинах. "
+        "PMI показує, наскільки частіше пара зустрічається разом, ніж можна очікувати випадково.\n\n"
+    )
+    markdown_text += "| Сутність 1 | Сутність 2 | Спільних новин | PMI |\n|---|---|---|---|\n"
+    for entity_1, entity_2, count, pmi in edges.itertuples(index=False):
+        markdown_text += f"| {entity_1} | {entity_2} | {count} | {pmi:.2f} |\n"
+
+    markdown_text += "\nНайчастіші пари по днях:\n\n"
+    for day, day_edges in edges_by_day.items():
+        pairs = ", ".join(f"{e1} ↔ {e2} ({count})"
+                          for e1, e2, count, _ in day_edges.itertuples(index=False))
+        markdown_text += f"- **{day}**: {pairs or 'немає повторюваних пар'}\n"
+
     return fig, markdown_text
+
+
+# ------------------------- Побудова графіків з агрегованих результатів -------------------------
+def plot_binned_histogram(counts, bin_edges, title, xlabel, ylabel, color='skyblue'):
+    """Гістограма з уже підрахованих кошиків (для інкрементального та поблочного аналізу)."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.bar(bin_edges[:-1], counts, width=np.diff(bin_edges), align='edge', color=color, edgecolor='black')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid(True)
+    fig.tight_layout()
+
+    return fig
+
+
+def plot_word_cloud_from_frequencies(word_counts, max_words=100):
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
+    if not word_counts:
+        return _empty_cloud_figure("Немає слів для хмари")
+
+    wordcloud = WordCloud(
+        width=800, height=400,
+        background_color='white',
+        max_words=max_words,
+        colormap='viridis'
+    ).generate_from_frequencies(dict(word_counts.most_common(max_words)))
+
+    fig = plt.figure(figsize=(10, 5))
+    plt.imshow(wordcloud, interpolation='bilinear')
+    plt.axis('off')
+    plt.show()
+
+    return fig